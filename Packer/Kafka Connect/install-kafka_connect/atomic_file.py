@@ -0,0 +1,39 @@
+import os
+import subprocess
+import tempfile
+
+RESTORECON = '/sbin/restorecon'
+
+def fsyncDirectory(directory):
+    # make the rename itself durable, not just the new file's contents
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def writeAtomically(path, lines, mode=0o644, relabel=False):
+    # write to a temp file alongside the original, fsync it and rename it into place,
+    # keeping the original's permissions and owner (or the given mode for a new file)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmpPath = tempfile.mkstemp(prefix='.'+os.path.basename(path)+'.', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            stat = os.stat(path)
+            os.chmod(tmpPath, stat.st_mode & 0o7777)
+            os.chown(tmpPath, stat.st_uid, stat.st_gid)
+        else:
+            os.chmod(tmpPath, mode)
+        os.rename(tmpPath, path)
+    except Exception:
+        os.unlink(tmpPath)
+        raise
+    fsyncDirectory(directory)
+
+    # the renamed file doesn't inherit the original's SELinux label
+    if relabel and os.path.exists(RESTORECON):
+        subprocess.call([RESTORECON, path])
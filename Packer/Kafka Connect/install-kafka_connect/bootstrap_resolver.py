@@ -0,0 +1,91 @@
+import re
+import socket
+import sys
+import threading
+import time
+import boto3
+import state_table
+import instance_metadata
+
+KAFKA_PORT = 9092
+CONNECT_TIMEOUT = 2
+# a few healthy brokers are enough to bootstrap from, the client learns the rest
+MAX_BOOTSTRAP_SERVERS = 3
+
+def getBrokers(client, tablename='kafka-state'):
+    # the brokers recorded in the kafka state as a dict of slot -> {ip, az}
+    state = state_table.getState(client, tablename, 'kafka')
+    brokers = {}
+    for slot in state:
+        # skip the restart lease and any other non-broker items
+        if re.match(r'^kafka\d+$', slot) is None:
+            continue
+        ip = state_table.getSlotIp(state, slot)
+        if ip == state_table.FREE_IP:
+            continue
+        brokers[slot] = {'ip':ip, 'az':state[slot].get('az', {}).get('S')}
+    return brokers
+
+def checkBroker(address, port=KAFKA_PORT, timeout=CONNECT_TIMEOUT):
+    # the TCP connect latency to the broker in ms, or None if it isn't accepting connections
+    started = time.time()
+    try:
+        socket.create_connection((address, port), timeout).close()
+    except socket.error:
+        return None
+    return (time.time() - started)*1000
+
+def checkBrokers(brokers):
+    # check every broker in parallel, returning a copy of the brokers with their latency added
+    latencies = {}
+    lock = threading.Lock()
+
+    def check(slot):
+        latency = checkBroker(brokers[slot]['ip'])
+        with lock:
+            latencies[slot] = latency
+
+    threads = [threading.Thread(target=check, args=(slot,)) for slot in brokers]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join(CONNECT_TIMEOUT*2)
+
+    # take a copy under the lock since a slow check may still be running, so the
+    # filter and sort below all see the same latencies
+    with lock:
+        answered = dict(latencies)
+    checked = {}
+    for slot in brokers:
+        checked[slot] = dict(brokers[slot])
+        checked[slot]['latency'] = answered.get(slot)
+    return checked
+
+def orderBrokers(brokers, localAz):
+    # healthy brokers in the local AZ first, then by latency; if none are healthy (e.g.
+    # the cluster is still starting) fall back to every known broker
+    healthy = [slot for slot in brokers if brokers[slot].get('latency') is not None]
+    if not healthy:
+        print('no broker is accepting connections yet, using every known broker')
+        return sorted(brokers)
+    return sorted(healthy, key=lambda slot: (brokers[slot]['az'] != localAz, brokers[slot]['latency']))
+
+def resolve(client, localAz=None, limit=MAX_BOOTSTRAP_SERVERS):
+    # render bootstrap.servers from the kafka state
+    if localAz is None:
+        localAz = instance_metadata.getIdentity()['availabilityZone']
+    brokers = checkBrokers(getBrokers(client))
+    for slot in sorted(brokers):
+        latency = brokers[slot].get('latency')
+        print(slot+' ('+brokers[slot]['ip']+', '+str(brokers[slot]['az'])+'): '+
+              ('unreachable' if latency is None else ('%.1f' % latency)+'ms'))
+
+    ordered = orderBrokers(brokers, localAz)[:limit]
+    if not ordered:
+        raise Exception('there are no brokers in the kafka state')
+    return ','.join(brokers[slot]['ip']+':'+str(KAFKA_PORT) for slot in ordered)
+
+if __name__ == "__main__":
+    session = boto3.Session(profile_name='terraform', region_name=instance_metadata.getIdentity()['region'])
+    print(resolve(session.client('dynamodb')))
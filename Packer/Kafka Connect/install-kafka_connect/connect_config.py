@@ -0,0 +1,215 @@
+import glob
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import boto3
+import bootstrap_resolver
+import connector_manager
+import instance_metadata
+import properties_file
+
+WORKER_PROPERTIES = '/opt/kafka/config/worker.properties'
+CONNECT_STANDALONE = '/opt/kafka/bin/connect-standalone.sh'
+
+# the internal topics are replicated like any other topic once there are enough brokers;
+# the config topic must always have a single partition
+MAX_REPLICATION_FACTOR = 3
+OFFSET_PARTITIONS = 25
+STATUS_PARTITIONS = 5
+
+# batch and compress the records connectors move through Kafka
+CLIENT_OVERRIDES = {
+    'producer.compression.type': 'lz4',
+    'producer.linger.ms': 20,
+    'producer.batch.size': 131072,
+    'consumer.fetch.min.bytes': 65536,
+    'consumer.fetch.max.wait.ms': 100,
+    'consumer.max.poll.records': 2000
+}
+
+# incremental cooperative rebalancing (Kafka 2.3+) moves only the tasks that have to
+# move when workers or connectors change, rather than stopping every task
+COOPERATIVE_VERSION = (2, 3)
+COOPERATIVE_SETTINGS = {
+    'connect.protocol': 'compatible',
+    'scheduled.rebalance.max.delay.ms': 120000
+}
+
+# consumers can fetch from a replica in their own rack (AZ) rather than the leader from
+# Kafka 2.4, when the brokers have broker.rack and the rack-aware replica selector set
+RACK_VERSION = (2, 4)
+
+# the data formats a worker can be set up for
+CONVERTERS = {
+    # JSON with an embedded schema in every record, the default
+    'json': {'converter': 'org.apache.kafka.connect.json.JsonConverter', 'schemas': 'true'},
+    # plain JSON, which halves the size of each record
+    'schemaless': {'converter': 'org.apache.kafka.connect.json.JsonConverter', 'schemas': 'false'},
+    # the raw bytes, for connectors that move data without interpreting it
+    'binary': {'converter': 'org.apache.kafka.connect.converters.ByteArrayConverter', 'schemas': None}
+}
+
+# how much data the file source/sink benchmark pushes through a local worker
+BENCHMARK_RECORDS = 100000
+BENCHMARK_RECORD_BYTES = 100
+BENCHMARK_DEADLINE = 300
+BENCHMARK_REST_PORT = 8084
+# the same topic every run: on 0.11 --delete only marks it for deletion unless the brokers
+# have delete.topic.enable=true, so a new name per run would leave a topic behind each time
+BENCHMARK_TOPIC = 'connect-benchmark'
+
+def getConverterSettings(converters):
+    settings = {}
+    for prefix in ['key', 'value']:
+        settings[prefix+'.converter'] = CONVERTERS[converters]['converter']
+        if CONVERTERS[converters]['schemas'] is not None:
+            settings[prefix+'.converter.schemas.enable'] = CONVERTERS[converters]['schemas']
+    return settings
+
+def getKafkaVersion(libs='/opt/kafka/libs'):
+    # the installed Kafka version from its jar, e.g. (0, 11, 0) for kafka_2.12-0.11.0.2.jar
+    for path in glob.glob(os.path.join(libs, 'kafka_*.jar')):
+        match = re.search(r'kafka_[\d.]+-(\d+)\.(\d+)\.(\d+)', os.path.basename(path))
+        if match is not None:
+            return tuple(int(part) for part in match.groups())
+    return (0, 0, 0)
+
+def computeSettings(brokerCount, converters='json', kafkaVersion=(0, 0, 0), rack=None):
+    # the worker settings for a cluster with the given number of brokers
+    replication = max(1, min(MAX_REPLICATION_FACTOR, brokerCount))
+    settings = {
+        'offset.storage.replication.factor': replication,
+        'offset.storage.partitions': OFFSET_PARTITIONS,
+        'config.storage.replication.factor': replication,
+        'status.storage.replication.factor': replication,
+        'status.storage.partitions': STATUS_PARTITIONS,
+        'offset.flush.interval.ms': 60000,
+        'offset.flush.timeout.ms': 10000
+    }
+    settings.update(CLIENT_OVERRIDES)
+    settings.update(getConverterSettings(converters))
+    if kafkaVersion >= COOPERATIVE_VERSION:
+        settings.update(COOPERATIVE_SETTINGS)
+    else:
+        print('Kafka '+'.'.join(str(part) for part in kafkaVersion)+' only has eager rebalancing')
+    if rack is not None and kafkaVersion >= RACK_VERSION:
+        settings['consumer.client.rack'] = rack
+    return settings
+
+def configure(client, kmaxInstances, converters='json', rack=None):
+    # size the internal topics from the brokers in the kafka state (or the ASG size if
+    # none have registered yet) and apply the worker profile
+    brokerCount = len(bootstrap_resolver.getBrokers(client)) or int(kmaxInstances)
+    print('configuring the worker for '+str(brokerCount)+' brokers with '+converters+' converters')
+    settings = computeSettings(brokerCount, converters, getKafkaVersion(), rack)
+    properties_file.sudoUpdateProperties(WORKER_PROPERTIES, settings)
+    return settings
+
+def countLines(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb') as f:
+        return sum(1 for line in f)
+
+def writeProperties(path, properties):
+    with open(path, 'w') as f:
+        for key in sorted(properties):
+            f.write(key+'='+str(properties[key])+'\n')
+
+def stopWorker(worker):
+    # stop the standalone worker and wait for it to exit, so nothing is still writing
+    # to the work dir when it is removed
+    if worker is not None and worker.poll() is None:
+        worker.terminate()
+        worker.wait()
+
+def deleteTopic(topic):
+    # the benchmark topic is auto-created by the source connector, so remove it afterwards;
+    # the sink resumes from its committed offsets if the topic is only marked for deletion
+    try:
+        subprocess.check_output([connector_manager.KAFKA_TOPICS, '--delete', '--zookeeper',
+                                 connector_manager.ZOOKEEPER_CONNECT, '--topic', topic], stderr=subprocess.STDOUT)
+        print('deleted the benchmark topic '+topic)
+    except (subprocess.CalledProcessError, OSError) as e:
+        print('unable to delete the benchmark topic '+topic+': '+str(e))
+
+def benchmark(records=BENCHMARK_RECORDS):
+    # push records from a file source connector to a file sink connector through Kafka
+    # on a local standalone worker, using this worker's client and converter settings,
+    # and return the records per second
+    workDir = tempfile.mkdtemp(prefix='connect-benchmark-')
+    worker = None
+    topic = BENCHMARK_TOPIC
+    succeeded = False
+    try:
+        inputFile = os.path.join(workDir, 'input.txt')
+        outputFile = os.path.join(workDir, 'output.txt')
+        with open(inputFile, 'w') as f:
+            line = 'x'*(BENCHMARK_RECORD_BYTES - 1)+'\n'
+            for i in range(records):
+                f.write(line)
+
+        settings = {}
+        for key, value in properties_file.readProperties(WORKER_PROPERTIES).items():
+            if key.split('.', 1)[0] in ['bootstrap', 'key', 'value', 'internal', 'producer', 'consumer']:
+                settings[key] = value
+        settings['offset.storage.file.filename'] = os.path.join(workDir, 'offsets')
+        settings['offset.flush.interval.ms'] = 1000
+        settings['rest.port'] = BENCHMARK_REST_PORT
+        writeProperties(os.path.join(workDir, 'worker.properties'), settings)
+        writeProperties(os.path.join(workDir, 'source.properties'), {
+            'name': 'benchmark-source', 'connector.class': 'FileStreamSource', 'tasks.max': 1,
+            'file': inputFile, 'topic': topic})
+        writeProperties(os.path.join(workDir, 'sink.properties'), {
+            'name': 'benchmark-sink', 'connector.class': 'FileStreamSink', 'tasks.max': 1,
+            'file': outputFile, 'topics': topic})
+
+        with open(os.path.join(workDir, 'worker.log'), 'w') as log:
+            worker = subprocess.Popen([CONNECT_STANDALONE] + [os.path.join(workDir, name) for name in
+                                      ['worker.properties', 'source.properties', 'sink.properties']],
+                                      stdout=log, stderr=subprocess.STDOUT)
+
+            # time from the first record arriving to the last, leaving out the JVM start
+            deadline = time.time() + BENCHMARK_DEADLINE
+            started = None
+            count = 0
+            while count < records and time.time() < deadline and worker.poll() is None:
+                time.sleep(0.2)
+                count = countLines(outputFile)
+                if started is None and count > 0:
+                    started = time.time()
+                    first = count
+
+        if count < records or started is None:
+            raise Exception('only '+str(count)+' of '+str(records)+' records arrived, see '+os.path.join(workDir, 'worker.log'))
+        seconds = max(time.time() - started, 0.001)
+        rate = (records - first) / seconds
+        print('metric connect_file_benchmark records='+str(records)+' records_per_second='+('%.0f' % rate)+
+              ' mb_per_second='+('%.1f' % (rate*BENCHMARK_RECORD_BYTES/1024/1024)))
+        succeeded = True
+        return rate
+    finally:
+        stopWorker(worker)
+        if worker is not None:
+            deleteTopic(topic)
+        # a failed run keeps its work dir for the worker log
+        if succeeded:
+            shutil.rmtree(workDir)
+
+if __name__ == "__main__":
+    # connect_config.py configure <max kafka instances> [json|schemaless|binary] [rack]
+    # connect_config.py benchmark [records]
+    if len(sys.argv) < 2 or sys.argv[1] not in ['configure', 'benchmark']:
+        print("Usage: "+sys.argv[0]+" configure <max kafka instances> ["+'|'.join(sorted(CONVERTERS))+"] | benchmark [records]")
+        sys.exit(1)
+
+    if sys.argv[1] == 'benchmark':
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else BENCHMARK_RECORDS)
+    else:
+        session = boto3.Session(profile_name='terraform', region_name=instance_metadata.getIdentity()['region'])
+        configure(session.client('dynamodb'), sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else 'json',
+                  sys.argv[4] if len(sys.argv) > 4 else None)
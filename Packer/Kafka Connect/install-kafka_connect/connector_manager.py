@@ -0,0 +1,166 @@
+import glob
+import json
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import time
+import boto3
+from six.moves import http_client
+import state_table
+import instance_metadata
+import properties_file
+
+WORKER_PROPERTIES = '/opt/kafka/config/worker.properties'
+DEFAULT_REST_PORT = 8083
+REST_TIMEOUT = 30
+# how long to wait for the worker's REST API to come up
+REST_DEADLINE = 300
+
+CONNECTORS_DIR = '/opt/kafka/config/connectors'
+KAFKA_TOPICS = '/opt/kafka/bin/kafka-topics.sh'
+ZOOKEEPER_CONNECT = os.environ.get('ZOOKEEPER_CONNECT', 'zookeeper1:2181,zookeeper2:2181,zookeeper3:2181/kafka')
+
+def getRestEndpoint(path=WORKER_PROPERTIES, getIdentity=instance_metadata.getIdentity):
+    # the [host, port] the worker's REST API listens on, from rest.host.name and rest.port
+    # in its config (conf_kafka_connect.py binds it to the node's host name); a worker
+    # bound to every interface is reached on the node's private IP
+    properties = properties_file.readProperties(path) if os.path.exists(path) else {}
+    host = os.environ.get('CONNECT_REST_HOST', properties.get('rest.host.name', ''))
+    if host == '':
+        host = getIdentity()['privateIp']
+    port = int(os.environ.get('CONNECT_REST_PORT', properties.get('rest.port', DEFAULT_REST_PORT)))
+    return [host, port]
+
+def request(endpoint, method, path, body=None):
+    # call the Connect REST API at [host, port], returning [status, parsed response]
+    conn = http_client.HTTPConnection(endpoint[0], endpoint[1], timeout=REST_TIMEOUT)
+    try:
+        headers = {'Accept':'application/json'}
+        payload = None
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+            payload = json.dumps(body)
+        conn.request(method, path, payload, headers)
+        response = conn.getresponse()
+        data = response.read().decode('utf-8')
+    finally:
+        conn.close()
+    return [response.status, json.loads(data) if data.strip() != '' else None]
+
+def waitForRest(endpoint, deadline=REST_DEADLINE):
+    started = time.time()
+    delay = 0.5
+    while True:
+        try:
+            if request(endpoint, 'GET', '/connectors')[0] == 200:
+                print('the connect REST API is up after '+('%.1f' % (time.time() - started))+'s')
+                return True
+        except Exception:
+            pass
+        if time.time() - started > deadline:
+            return False
+        time.sleep(delay)
+        delay = min(delay*2, 10)
+
+def loadConnectors(directory):
+    # the desired connectors from *.json files of the form {"name": ..., "config": {...}}
+    connectors = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        with open(path, 'r') as f:
+            definition = json.load(f)
+        config = dict((key, str(value)) for key, value in definition['config'].items())
+        config['name'] = definition['name']
+        connectors[definition['name']] = config
+    return connectors
+
+def getWorkerCount(client):
+    state = state_table.getState(client, 'kafka_connect-state', 'kafka_connect')
+    return len([slot for slot in state if state_table.getSlotIp(state, slot) != state_table.FREE_IP]) or 1
+
+def getPartitionCount(topic):
+    output = subprocess.check_output([KAFKA_TOPICS, '--describe', '--zookeeper', ZOOKEEPER_CONNECT,
+                                      '--topic', topic]).decode('utf-8')
+    match = re.search(r'PartitionCount:\s*(\d+)', output)
+    return int(match.group(1)) if match is not None else 0
+
+def getTopics(config):
+    topics = config.get('topics', config.get('topic', ''))
+    return [topic.strip() for topic in topics.split(',') if topic.strip() != '']
+
+def sizeTasks(config, workers, cpus, partitionCount=getPartitionCount):
+    # "auto" tasks: one per partition of the connector's topics, but no more than the
+    # workers' cores can run; a connector without topics gets one task per worker
+    if config.get('tasks.max') != 'auto':
+        return config
+    sized = dict(config)
+    topics = getTopics(config)
+    if topics:
+        partitions = sum(partitionCount(topic) for topic in topics)
+        sized['tasks.max'] = str(max(1, min(partitions, workers*cpus)))
+    else:
+        sized['tasks.max'] = str(workers)
+    print(config['name']+' tasks.max auto sized to '+sized['tasks.max'])
+    return sized
+
+def planChanges(desired, current):
+    # compare the desired connector configs with the running ones, returning
+    # [connectors to create or update, connectors only running in the cluster]
+    changed = []
+    for name in sorted(desired):
+        if current.get(name) != desired[name]:
+            changed.append(name)
+    extra = sorted(name for name in current if name not in desired)
+    return [changed, extra]
+
+def getCurrentConfigs(endpoint):
+    status, names = request(endpoint, 'GET', '/connectors')
+    if status != 200:
+        raise Exception('listing the connectors failed with status '+str(status)+': '+str(names))
+    current = {}
+    for name in names:
+        status, config = request(endpoint, 'GET', '/connectors/'+name+'/config')
+        if status == 200:
+            current[name] = dict((key, str(value)) for key, value in config.items())
+    return current
+
+def apply(client, directory=CONNECTORS_DIR, prune=False, workerProperties=WORKER_PROPERTIES):
+    # apply the connectors in the directory, touching only those that changed since each
+    # PUT or DELETE makes the cluster rebalance
+    desired = loadConnectors(directory)
+    if not desired and not prune:
+        print('there are no connectors defined in '+directory)
+        return [[], []]
+    endpoint = getRestEndpoint(workerProperties)
+    if not waitForRest(endpoint):
+        raise Exception('the connect REST API on '+endpoint[0]+':'+str(endpoint[1])+' is not up')
+
+    workers = getWorkerCount(client)
+    cpus = multiprocessing.cpu_count()
+    for name in desired:
+        desired[name] = sizeTasks(desired[name], workers, cpus)
+
+    changed, extra = planChanges(desired, getCurrentConfigs(endpoint))
+    for name in changed:
+        started = time.time()
+        status, response = request(endpoint, 'PUT', '/connectors/'+name+'/config', desired[name])
+        if status not in [200, 201]:
+            raise Exception('applying '+name+' failed with status '+str(status)+': '+str(response))
+        print(('created ' if status == 201 else 'updated ')+name+' in '+('%.2f' % (time.time() - started))+'s')
+
+    for name in extra:
+        if prune:
+            status, response = request(endpoint, 'DELETE', '/connectors/'+name)
+            print('deleted '+name+' (status '+str(status)+')')
+        else:
+            print(name+' is running but not defined in '+directory+', leaving it')
+
+    print(str(len(changed))+' connectors changed, '+str(len(desired) - len(changed))+' unchanged')
+    return [changed, extra]
+
+if __name__ == "__main__":
+    # connector_manager.py [connectors directory] [prune]
+    directory = sys.argv[1] if len(sys.argv) > 1 else CONNECTORS_DIR
+    session = boto3.Session(profile_name='terraform', region_name=instance_metadata.getIdentity()['region'])
+    apply(session.client('dynamodb'), directory, 'prune' in sys.argv[2:])
@@ -36,8 +36,9 @@ rm kafka_2.12-0.11.0.2.tgz
 
 sudo cp /tmp/install-kafka_connect/worker.properties /opt/kafka/config/worker.properties
 sudo cp /tmp/install-kafka_connect/connect-log4j.properties /opt/kafka/config/connect-log4j.properties
-sudo cp /tmp/install-kafka_connect/kafka-connect-stop.sh /opt/kafka/bin/kafka-connect-stop.sh
-sudo chmod +x /opt/kafka/bin/kafka-connect-stop.sh
+sudo cp /tmp/install-kafka_connect/kafka_supervisor.py /opt/kafka/bin/kafka_supervisor.py
+# connector definitions applied by connector_manager.py
+sudo mkdir -p /opt/kafka/config/connectors
 
 # Install Kafka connect boot scripts
 sudo mv /tmp/install-kafka_connect/kafka_connect_service /etc/init.d/kafkaconnect
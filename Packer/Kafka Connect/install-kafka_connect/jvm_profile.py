@@ -0,0 +1,229 @@
+import os
+import re
+import subprocess
+import sys
+import atomic_file
+
+MB = 1024*1024
+GB = 1024*MB
+
+# per role JVM sizing, each service sources its env file before starting the JVM
+# - daemonName: the -name the start script gives the JVM, passed on without -loggc so
+#   kafka-run-class.sh keeps our KAFKA_GC_LOG_OPTS rather than replacing them with its own
+# - heapFraction: share of memory for the heap, the rest is page cache and OS headroom
+# - minHeapBytes/maxHeapBytes: bounds on the heap whatever the instance size
+ROLES = {
+    'kafka': {
+        'mainClass': 'kafka.Kafka',
+        'envFile': '/opt/kafka/config/kafka-env.sh',
+        'daemonName': 'kafkaServer',
+        'gcLog': '/opt/kafka/logs/kafkaServer-gc.log',
+        # the broker relies on the page cache, not the heap, for throughput
+        'heapFraction': 0.25,
+        'minHeapBytes': 1*GB,
+        'maxHeapBytes': 6*GB
+    },
+    'zookeeper': {
+        'mainClass': 'org.apache.zookeeper.server.quorum.QuorumPeerMain',
+        'envFile': '/opt/zookeeper/kafka/config/zookeeper-env.sh',
+        'daemonName': 'zookeeper',
+        'gcLog': '/opt/zookeeper/kafka/logs/zookeeper-gc.log',
+        # the whole data tree lives on the heap and must never be swapped
+        'heapFraction': 0.5,
+        'minHeapBytes': 512*MB,
+        'maxHeapBytes': 4*GB
+    },
+    'connect': {
+        'mainClass': 'org.apache.kafka.connect.cli.ConnectDistributed',
+        'envFile': '/opt/kafka/config/connect-env.sh',
+        'daemonName': 'connectDistributed',
+        'gcLog': '/opt/kafka/logs/connect-gc.log',
+        # connectors buffer records on the heap
+        'heapFraction': 0.5,
+        'minHeapBytes': 1*GB,
+        'maxHeapBytes': 8*GB
+    }
+}
+
+# memory always left to the OS whatever the fraction
+OS_RESERVE_BYTES = 512*MB
+GC_LOG_FILES = 10
+GC_LOG_FILE_SIZE = '100M'
+# ZGC is production ready from JDK 15
+ZGC_JAVA_VERSION = 15
+
+def getMemoryBytes():
+    with open('/proc/meminfo', 'r') as f:
+        for line in f:
+            if line.startswith('MemTotal:'):
+                return int(line.split()[1])*1024
+    raise Exception('MemTotal is missing from /proc/meminfo')
+
+def getJavaVersion():
+    # the major version of the installed JVM, e.g. 8 for "1.8.0_152" or 17 for "17.0.2"
+    output = subprocess.check_output(['java', '-version'], stderr=subprocess.STDOUT).decode('utf-8')
+    match = re.search(r'version "(\d+)(?:\.(\d+))?', output)
+    if match is None:
+        raise Exception('unable to parse the java version from: '+output)
+    major = int(match.group(1))
+    if major == 1 and match.group(2) is not None:
+        major = int(match.group(2))
+    return major
+
+def getHeapMb(role, memoryBytes):
+    settings = ROLES[role]
+    ceiling = memoryBytes - OS_RESERVE_BYTES
+    minHeap = settings['minHeapBytes']
+    if minHeap > ceiling:
+        # never let the minimum eat into the OS reserve on small instances
+        print('warning: '+role+' minimum heap of '+str(minHeap // MB)+'MB leaves less than '+str(OS_RESERVE_BYTES // MB)+'MB of '+str(memoryBytes // MB)+'MB to the OS, capping it at '+str(ceiling // MB)+'MB')
+        minHeap = ceiling
+    heap = int(memoryBytes*settings['heapFraction'])
+    heap = min(heap, ceiling, settings['maxHeapBytes'])
+    heap = max(heap, minHeap)
+    # whole G1 regions, so the running JVM reports exactly the size asked for
+    return heap // (16*MB) * 16
+
+def getGcOptions(javaVersion):
+    if javaVersion >= ZGC_JAVA_VERSION:
+        return ['-XX:+UseZGC']
+    # the G1 settings recommended for brokers: https://kafka.apache.org/documentation/#java
+    return ['-XX:+UseG1GC', '-XX:MaxGCPauseMillis=20', '-XX:InitiatingHeapOccupancyPercent=35',
+            '-XX:G1HeapRegionSize=16M', '-XX:MinMetaspaceFreeRatio=50', '-XX:MaxMetaspaceFreeRatio=80']
+
+def getGcLogOptions(role, javaVersion):
+    # rotate the GC log so it can be left on permanently
+    gcLog = ROLES[role]['gcLog']
+    if javaVersion >= 9:
+        return ['-Xlog:gc*:file='+gcLog+':time,tags:filecount='+str(GC_LOG_FILES)+',filesize='+GC_LOG_FILE_SIZE]
+    return ['-Xloggc:'+gcLog, '-verbose:gc', '-XX:+PrintGCDetails', '-XX:+PrintGCDateStamps',
+            '-XX:+PrintGCApplicationStoppedTime', '-XX:+UseGCLogFileRotation',
+            '-XX:NumberOfGCLogFiles='+str(GC_LOG_FILES), '-XX:GCLogFileSize='+GC_LOG_FILE_SIZE]
+
+def computeProfile(role, memoryBytes, javaVersion):
+    # the heap size and JVM options for the role, returning [heapMb, environment]
+    heapMb = getHeapMb(role, memoryBytes)
+    options = ['-server'] + getGcOptions(javaVersion)
+    # touch the whole heap at start rather than faulting it in under load
+    options += ['-XX:+AlwaysPreTouch', '-XX:+ExplicitGCInvokesConcurrent', '-Djava.awt.headless=true']
+    environment = {
+        'KAFKA_HEAP_OPTS': '-Xms'+str(heapMb)+'m -Xmx'+str(heapMb)+'m',
+        'KAFKA_JVM_PERFORMANCE_OPTS': ' '.join(options),
+        'KAFKA_GC_LOG_OPTS': ' '.join(getGcLogOptions(role, javaVersion)),
+        'EXTRA_ARGS': '-name '+ROLES[role]['daemonName']
+    }
+    return [heapMb, environment]
+
+def shellQuote(value):
+    return "'"+value.replace("'", "'\"'\"'")+"'"
+
+def getEnvLines(environment):
+    # the env file is sourced by the service scripts, so write it as shell
+    lines = ['# generated by jvm_profile.py, sourced before the JVM starts\n']
+    for name in sorted(environment):
+        lines.append('export '+name+'='+shellQuote(environment[name])+'\n')
+    return lines
+
+def writeEnvFile(path, environment):
+    # rewrite the env file only if the profile has changed
+    lines = getEnvLines(environment)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            if f.readlines() == lines:
+                print(path+' is already up to date')
+                return False
+    atomic_file.writeAtomically(path, lines)
+    print('wrote '+path+':\n'+''.join(lines))
+    return True
+
+def render(role):
+    memoryBytes = getMemoryBytes()
+    javaVersion = getJavaVersion()
+    retvals = computeProfile(role, memoryBytes, javaVersion)
+    print(role+': java '+str(javaVersion)+', memory '+str(memoryBytes // MB)+'MB, heap '+str(retvals[0])+'MB')
+    writeEnvFile(ROLES[role]['envFile'], retvals[1])
+    return retvals
+
+def getGcLogFile(args):
+    # the GC log file the JVM is writing to, from the last GC log option on its command line
+    gcLog = None
+    for arg in args:
+        if arg.startswith('-Xloggc:'):
+            gcLog = arg[len('-Xloggc:'):]
+        elif arg.startswith('-Xlog:gc') and ':file=' in arg:
+            gcLog = arg.split(':file=', 1)[1].split(':', 1)[0]
+    return gcLog
+
+def getCommandLine(pid):
+    with open('/proc/'+str(pid)+'/cmdline', 'rb') as f:
+        return f.read().decode('utf-8', 'replace').split('\0')
+
+def findPid(role):
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/'+entry+'/cmdline', 'rb') as f:
+                args = f.read().decode('utf-8', 'replace').split('\0')
+        except IOError:
+            continue
+        if ROLES[role]['mainClass'] in args:
+            return int(entry)
+    return None
+
+def getJcmd():
+    javaHome = os.environ.get('JAVA_HOME', '/usr/java/default')
+    if os.path.exists(os.path.join(javaHome, 'bin', 'jcmd')):
+        return os.path.join(javaHome, 'bin', 'jcmd')
+    return 'jcmd'
+
+def getRunningFlags(pid):
+    # the flags of the running JVM as a dict, e.g. {'MaxHeapSize':'1073741824', 'UseG1GC':'true'}
+    output = subprocess.check_output([getJcmd(), str(pid), 'VM.flags']).decode('utf-8')
+    flags = {}
+    for match in re.finditer(r'-XX:([+-])?(\w+)(?:=(\S+))?', output):
+        if match.group(1) is not None:
+            flags[match.group(2)] = 'true' if match.group(1) == '+' else 'false'
+        else:
+            flags[match.group(2)] = match.group(3)
+    return flags
+
+def verify(role):
+    # read back the flags of the running JVM and check they match the profile
+    pid = findPid(role)
+    if pid is None:
+        print(role+' is not running, nothing to verify')
+        return False
+    javaVersion = getJavaVersion()
+    heapMb = computeProfile(role, getMemoryBytes(), javaVersion)[0]
+    flags = getRunningFlags(pid)
+    print(role+' (PID: '+str(pid)+') is running with: '+str(flags))
+
+    expected = {'MaxHeapSize': str(heapMb*MB)}
+    if javaVersion >= ZGC_JAVA_VERSION:
+        expected['UseZGC'] = 'true'
+    else:
+        expected['UseG1GC'] = 'true'
+
+    mismatches = []
+    for flag in sorted(expected):
+        if flags.get(flag) != expected[flag]:
+            mismatches.append(flag+'='+str(flags.get(flag))+' (expected '+expected[flag]+')')
+    gcLog = getGcLogFile(getCommandLine(pid))
+    if gcLog != ROLES[role]['gcLog']:
+        mismatches.append('GC log='+str(gcLog)+' (expected '+ROLES[role]['gcLog']+')')
+    if mismatches:
+        print(role+' JVM flags do not match the profile: '+', '.join(mismatches))
+        return False
+    print(role+' JVM flags match the profile')
+    return True
+
+if __name__ == "__main__":
+    # jvm_profile.py <kafka|zookeeper|connect> [render|verify]
+    if len(sys.argv) < 2 or sys.argv[1] not in ROLES:
+        print("Usage: "+sys.argv[0]+" <"+'|'.join(sorted(ROLES))+"> [render|verify]")
+        sys.exit(1)
+    action = sys.argv[2] if len(sys.argv) > 2 else 'render'
+    if action == 'verify':
+        sys.exit(0 if verify(sys.argv[1]) else 1)
+    render(sys.argv[1])
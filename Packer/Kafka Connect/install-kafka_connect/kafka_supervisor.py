@@ -0,0 +1,195 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+DAEMON_PATH = '/opt/kafka/bin'
+CONFIG_PATH = '/opt/kafka/config'
+
+# the main class identifies the JVM in /proc/<pid>/cmdline, the port tells us it is serving
+ROLES = {
+    'kafka': {
+        'name': 'Kafka',
+        'mainClass': 'kafka.Kafka',
+        'command': [DAEMON_PATH+'/kafka-server-start.sh', '-daemon', CONFIG_PATH+'/server.properties'],
+        'config': CONFIG_PATH+'/server.properties',
+        'port': 9092,
+        'pidfile': '/var/run/kafka.pid'
+    },
+    'connect': {
+        'name': 'Kafka Connect',
+        'mainClass': 'org.apache.kafka.connect.cli.ConnectDistributed',
+        'command': [DAEMON_PATH+'/connect-distributed.sh', '-daemon', CONFIG_PATH+'/worker.properties'],
+        'config': CONFIG_PATH+'/worker.properties',
+        'port': 8083,
+        'pidfile': '/var/run/kafkaconnect.pid'
+    }
+}
+
+# a controlled shutdown moves leadership away and flushes the logs, which can take a while
+START_TIMEOUT = int(os.environ.get('SUPERVISOR_START_TIMEOUT', 300))
+STOP_TIMEOUT = int(os.environ.get('SUPERVISOR_STOP_TIMEOUT', 180))
+KILL_TIMEOUT = 30
+POLL_INTERVAL = 0.1
+
+def isRole(pid, role):
+    # check the process is the JVM for this role, not just a reused PID
+    try:
+        with open('/proc/'+str(pid)+'/cmdline', 'rb') as f:
+            args = f.read().decode('utf-8', 'replace').split('\0')
+    except IOError:
+        return False
+    return ROLES[role]['mainClass'] in args
+
+def findPid(role):
+    # the PID from the pidfile if it is still ours, otherwise search /proc for the JVM
+    pidfile = ROLES[role]['pidfile']
+    try:
+        with open(pidfile, 'r') as f:
+            pid = int(f.read().strip())
+        if isRole(pid, role):
+            return pid
+    except (IOError, ValueError):
+        pass
+
+    for entry in os.listdir('/proc'):
+        if entry.isdigit() and isRole(int(entry), role):
+            writePidfile(role, int(entry))
+            return int(entry)
+    return None
+
+def writePidfile(role, pid):
+    try:
+        with open(ROLES[role]['pidfile'], 'w') as f:
+            f.write(str(pid)+'\n')
+    except IOError as e:
+        print('unable to write pidfile: '+str(e))
+
+def removePidfile(role):
+    try:
+        os.unlink(ROLES[role]['pidfile'])
+    except OSError:
+        pass
+
+def isAlive(pid):
+    # a zombie has released everything, so treat it as gone
+    try:
+        with open('/proc/'+str(pid)+'/stat', 'r') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except IOError:
+        return False
+
+def isListening(port):
+    # look for a listening socket on the port in the kernel tables rather than connecting to it
+    for table in ['/proc/net/tcp', '/proc/net/tcp6']:
+        try:
+            with open(table, 'r') as f:
+                lines = f.readlines()[1:]
+        except IOError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if fields[3] == '0A' and int(fields[1].rsplit(':', 1)[1], 16) == port:
+                return True
+    return False
+
+def waitUntil(check, deadline):
+    # poll check() until it returns True, returning False if the deadline passes first
+    while not check():
+        if time.time() > deadline:
+            return False
+        time.sleep(POLL_INTERVAL)
+    return True
+
+def getLogDirs(role):
+    # the broker's log directories, where it leaves a marker after a clean shutdown
+    if role != 'kafka':
+        return []
+    with open(ROLES[role]['config'], 'r') as f:
+        for line in f:
+            if line.startswith('log.dirs=') or line.startswith('log.dir='):
+                return [d.strip() for d in line.split('=', 1)[1].split(',') if d.strip() != '']
+    return ['/tmp/kafka-logs']
+
+def isCleanShutdown(role):
+    logDirs = getLogDirs(role)
+    return all(os.path.exists(os.path.join(d, '.kafka_cleanshutdown')) for d in logDirs)
+
+def start(role):
+    name = ROLES[role]['name']
+    pid = findPid(role)
+    if pid is not None:
+        print(name+' is already running as PID: '+str(pid))
+        return 0
+
+    print('Starting '+name)
+    started = time.time()
+    subprocess.check_call(ROLES[role]['command'])
+
+    deadline = started + START_TIMEOUT
+    if not waitUntil(lambda: findPid(role) is not None, deadline):
+        print(name+' did not start')
+        return 1
+    pid = findPid(role)
+    if not waitUntil(lambda: isListening(ROLES[role]['port']) or not isAlive(pid), deadline) or not isAlive(pid):
+        print(name+' (PID: '+str(pid)+') is not listening on port '+str(ROLES[role]['port']))
+        return 1
+    print(name+' started as PID: '+str(pid)+' in '+('%.1f' % (time.time() - started))+'s')
+    return 0
+
+def stop(role):
+    name = ROLES[role]['name']
+    pid = findPid(role)
+    if pid is None:
+        print(name+' is not running')
+        removePidfile(role)
+        return 0
+
+    print('Shutting down '+name+' (PID: '+str(pid)+')')
+    started = time.time()
+    os.kill(pid, signal.SIGTERM)
+
+    # wait for the shutdown hooks to finish and the port to be released
+    stopped = waitUntil(lambda: not isAlive(pid), started + STOP_TIMEOUT)
+    if not stopped:
+        print(name+' did not shut down within '+str(STOP_TIMEOUT)+'s, killing it')
+        os.kill(pid, signal.SIGKILL)
+        waitUntil(lambda: not isAlive(pid), time.time() + KILL_TIMEOUT)
+    if isAlive(pid):
+        print(name+' (PID: '+str(pid)+') is still running after being killed')
+        return 1
+    removePidfile(role)
+    if not waitUntil(lambda: not isListening(ROLES[role]['port']), time.time() + KILL_TIMEOUT):
+        print(name+' stopped but port '+str(ROLES[role]['port'])+' is still bound')
+        return 1
+
+    clean = stopped and isCleanShutdown(role)
+    print(name+' stopped '+('cleanly' if clean else 'uncleanly')+' in '+('%.1f' % (time.time() - started))+'s')
+    return 0
+
+def status(role):
+    name = ROLES[role]['name']
+    pid = findPid(role)
+    if pid is None:
+        print(name+' is not Running')
+        return 3
+    listening = 'listening' if isListening(ROLES[role]['port']) else 'not listening'
+    print(name+' is Running as PID: '+str(pid)+' ('+listening+' on port '+str(ROLES[role]['port'])+')')
+    return 0
+
+def restart(role):
+    # only start a new process once the old one has gone and released the port
+    result = stop(role)
+    if result != 0:
+        print('not starting '+ROLES[role]['name']+' again since it did not stop')
+        return result
+    return start(role)
+
+if __name__ == "__main__":
+    # kafka_supervisor.py <kafka|connect> <start|stop|restart|status>
+    actions = {'start':start, 'stop':stop, 'restart':restart, 'status':status}
+    if len(sys.argv) != 3 or sys.argv[1] not in ROLES or sys.argv[2] not in actions:
+        print("Usage: "+sys.argv[0]+" <"+'|'.join(sorted(ROLES))+"> <start|stop|restart|status>")
+        sys.exit(1)
+    sys.exit(actions[sys.argv[2]](sys.argv[1]))
@@ -0,0 +1,113 @@
+import os
+import random
+import re
+import time
+
+# the EC2 API accepts at most 200 values per filter, so larger ASGs are
+# looked up in chunks of this size (still a single paginated call per chunk)
+FILTER_CHUNK = 200
+
+def getNameTags(session, instanceIds, region):
+    # fetch the Name tag of every instance in one paginated describe_tags call,
+    # returning a dict of instance id -> Name tag value
+    tags = {}
+    if not instanceIds:
+        return tags
+
+    ec2 = session.client('ec2', region_name=region)
+    paginator = ec2.get_paginator('describe_tags')
+    index = 0
+    while index < len(instanceIds):
+        chunk = instanceIds[index:index+FILTER_CHUNK]
+        index += FILTER_CHUNK
+        pages = paginator.paginate(
+            Filters=[
+                {'Name':'resource-id', 'Values':chunk},
+                {'Name':'key', 'Values':['Name']}
+            ]
+        )
+        for page in pages:
+            for tag in page['Tags']:
+                tags[tag['ResourceId']] = tag['Value'].strip()
+
+    print('the instance Name tags are: '+str(tags))
+    return tags
+
+def getSlotNumber(tag, prefix):
+    # return the node number at the end of a Name tag such as kafka3,
+    # or None if the tag hasn't been allocated a slot yet
+    match = re.match('^'+re.escape(prefix)+r'(\d+)$', tag)
+    if match is None:
+        return None
+    return int(match.group(1))
+
+def getSlots(session, nodeList, prefix, region):
+    # map every instance in the ASG list to the slot it holds
+    instanceIds = [item['InstanceId'] for item in nodeList]
+    tags = getNameTags(session, instanceIds, region)
+
+    slots = {}
+    for instanceId in instanceIds:
+        slots[instanceId] = getSlotNumber(tags.get(instanceId, ''), prefix)
+
+    print('the instance slots are: '+str(slots))
+    return slots
+
+# how long to wait for the ASG to propagate the Name tag to a new instance,
+# these can be overridden from the environment
+TAG_WAIT_DEADLINE = float(os.environ.get('TAG_WAIT_DEADLINE', '180'))
+TAG_WAIT_INITIAL_DELAY = float(os.environ.get('TAG_WAIT_INITIAL_DELAY', '0.5'))
+TAG_WAIT_MAX_DELAY = float(os.environ.get('TAG_WAIT_MAX_DELAY', '15'))
+
+# once the instance reaches one of these lifecycle states the ASG has finished
+# launching it, so a missing tag is never going to appear
+SETTLED_STATES = ['InService', 'Standby', 'Terminating', 'Terminating:Wait', 'Terminating:Proceed', 'Terminated']
+
+def getLifecycleState(session, instanceId, region):
+    asg = session.client('autoscaling', region_name=region)
+    response = asg.describe_auto_scaling_instances(InstanceIds=[instanceId])
+    instances = response['AutoScalingInstances']
+    if not instances:
+        return None
+    return instances[0]['LifecycleState']
+
+def emitTiming(name, started, attempts, outcome):
+    # timing metrics go to the user-data log alongside the rest of the boot output
+    print('metric '+name+' seconds='+('%.3f' % (time.time() - started))+' attempts='+str(attempts)+' outcome='+outcome)
+
+def waitForNameTag(session, instanceId, region, deadline=None, initialDelay=None, maxDelay=None, sleep=time.sleep):
+    # poll for the instance Name tag with exponential backoff and full jitter,
+    # returning as soon as it appears, or '' once the deadline passes or the
+    # ASG has settled the instance without tagging it
+    if deadline is None:
+        deadline = TAG_WAIT_DEADLINE
+    if initialDelay is None:
+        initialDelay = TAG_WAIT_INITIAL_DELAY
+    if maxDelay is None:
+        maxDelay = TAG_WAIT_MAX_DELAY
+
+    started = time.time()
+    expires = started + deadline
+    attempts = 0
+    settled = False
+    while True:
+        attempts += 1
+        tagName = getNameTags(session, [instanceId], region).get(instanceId, '')
+        if tagName != '':
+            emitTiming('name_tag_wait', started, attempts, 'found')
+            return tagName
+
+        # give the tag one more poll after the ASG has settled the instance
+        if settled:
+            emitTiming('name_tag_wait', started, attempts, 'settled')
+            return ''
+        state = getLifecycleState(session, instanceId, region)
+        print('there is no value for the instance tag, lifecycle state is: '+str(state))
+        settled = state in SETTLED_STATES
+
+        remaining = expires - time.time()
+        if remaining <= 0:
+            emitTiming('name_tag_wait', started, attempts, 'deadline')
+            return ''
+        delay = random.uniform(0, min(maxDelay, initialDelay * (2 ** attempts)))
+        sleep(min(delay, remaining))
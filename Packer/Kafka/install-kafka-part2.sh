@@ -21,6 +21,7 @@ sudo mv /tmp/install-kafka/server.properties /opt/kafka/config/server.properties
 # launch kafka - make sure things look okay
 
 # Install Kafka boot scripts
+sudo mv /tmp/install-kafka/kafka_supervisor.py /opt/kafka/bin/kafka_supervisor.py
 sudo mv /tmp/install-kafka/kafka_service /etc/init.d/kafka
 sudo chmod +x /etc/init.d/kafka
 sudo chown root:root /etc/init.d/kafka
@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import boto3
+import instance_metadata
+import properties_file
+import slot_allocator
+import state_table
+
+SERVER_PROPERTIES = '/opt/kafka/config/server.properties'
+TABLENAME = 'kafka-state'
+CLUSTER = 'kafka'
+# how long the broker has to write meta.properties once it has been started
+META_WAIT = 300
+META_INTERVAL = 2
+
+# The kafka-state slot item holds the broker's identity, so whichever instance holds the
+# slot comes up as the same broker and picks up its replicas straight away:
+#   broker_id  - the broker.id of the slot, the slot number unless set otherwise
+#   cluster_id - the cluster.id the broker wrote to meta.properties on its first start
+
+def getBrokerId(item, slot):
+    if 'broker_id' in item:
+        return int(item['broker_id']['N'])
+    return slot_allocator.getNodeId(slot, CLUSTER)
+
+def getClusterId(item):
+    return item.get('cluster_id', {}).get('S')
+
+def getLogDirs(path=SERVER_PROPERTIES):
+    properties = properties_file.readProperties(path)
+    logDirs = properties.get('log.dirs', properties.get('log.dir', '/tmp/kafka-logs'))
+    return [d.strip() for d in logDirs.split(',') if d.strip() != '']
+
+def readMeta(logDirs):
+    # the meta.properties of every log dir that has one, a fresh volume has none
+    metas = {}
+    for logDir in logDirs:
+        path = os.path.join(logDir, 'meta.properties')
+        if os.path.exists(path):
+            metas[logDir] = properties_file.readProperties(path)
+    return metas
+
+def waitForMeta(logDirs, deadline=META_WAIT, sleep=time.sleep):
+    # the broker writes meta.properties to its log dirs shortly after it starts, so wait
+    # for every log dir to have a cluster.id, returning whatever is there at the deadline
+    started = time.time()
+    while True:
+        metas = readMeta(logDirs)
+        if len(metas) == len(logDirs) and all('cluster.id' in meta for meta in metas.values()):
+            print('meta.properties written to '+str(len(metas))+' log dirs after '+('%.1f' % (time.time() - started))+'s')
+            return metas
+        if time.time() - started > deadline:
+            print('gave up waiting for meta.properties, found it in '+str(sorted(metas)))
+            return metas
+        sleep(META_INTERVAL)
+
+def checkIdentity(brokerId, clusterId, configuredId, metas):
+    # compare the slot's identity with server.properties and the data on disk,
+    # returning a list of the mismatches
+    problems = []
+    if configuredId != str(brokerId):
+        problems.append('server.properties has broker.id='+str(configuredId)+' but the slot has '+str(brokerId))
+    for logDir in sorted(metas):
+        if metas[logDir].get('broker.id') != str(brokerId):
+            problems.append(logDir+' belongs to broker.id='+str(metas[logDir].get('broker.id'))+' not '+str(brokerId))
+        if clusterId is not None and metas[logDir].get('cluster.id', clusterId) != clusterId:
+            problems.append(logDir+' belongs to cluster.id='+metas[logDir]['cluster.id']+' not '+clusterId)
+    return problems
+
+def getSlot(client, ip):
+    # the slot this node holds in the kafka state, and its item
+    state = state_table.getState(client, TABLENAME, CLUSTER)
+    for slot in state:
+        if state_table.getSlotIp(state, slot) == ip:
+            return [slot, state[slot]]
+    raise Exception('no '+CLUSTER+' slot is held by '+ip)
+
+def verify(client, ip):
+    # check the broker will start as the slot's broker, on data from the slot's cluster
+    slot, item = getSlot(client, ip)
+    brokerId = getBrokerId(item, slot)
+    configuredId = properties_file.readProperties(SERVER_PROPERTIES).get('broker.id')
+    metas = readMeta(getLogDirs())
+    problems = checkIdentity(brokerId, getClusterId(item), configuredId, metas)
+    for problem in problems:
+        print(problem)
+    if problems:
+        return False
+    print(slot+' is broker.id='+str(brokerId)+' with '+str(len(metas))+' existing log dirs')
+    return True
+
+def record(client, ip, deadline=META_WAIT):
+    # record the cluster.id the broker wrote on its first start against its slot
+    slot, item = getSlot(client, ip)
+    clusterIds = set(meta['cluster.id'] for meta in waitForMeta(getLogDirs(), deadline).values() if 'cluster.id' in meta)
+    if len(clusterIds) != 1:
+        print('unable to determine the cluster.id from the log dirs: '+str(sorted(clusterIds)))
+        return False
+    clusterId = clusterIds.pop()
+    if getClusterId(item) == clusterId:
+        print(slot+' already has cluster.id='+clusterId)
+        return True
+    if getClusterId(item) is not None:
+        print(slot+' has cluster.id='+getClusterId(item)+' but the broker is running with '+clusterId)
+        return False
+    state_table.setSlotAttributes(client, TABLENAME, CLUSTER, slot, {'cluster_id': {'S':clusterId}})
+    print('recorded cluster.id='+clusterId+' for '+slot)
+    return True
+
+if __name__ == "__main__":
+    # broker_identity.py <verify|record>
+    actions = {'verify':verify, 'record':record}
+    if len(sys.argv) != 2 or sys.argv[1] not in actions:
+        print("Usage: "+sys.argv[0]+" <verify|record>")
+        sys.exit(1)
+
+    identity = instance_metadata.getIdentity()
+    session = boto3.Session(profile_name='terraform', region_name=identity['region'])
+    sys.exit(0 if actions[sys.argv[1]](session.client('dynamodb'), identity['privateIp']) else 1)
@@ -0,0 +1,124 @@
+import glob
+import multiprocessing
+import os
+import re
+import sys
+import instance_metadata
+import properties_file
+
+SERVER_PROPERTIES = '/opt/kafka/config/server.properties'
+DATA_ROOT = '/data'
+DEFAULT_LOG_DIR = '/data/kafka'
+
+# followers can serve fetches from consumers in the same rack (the broker's AZ) from
+# Kafka 2.4, older brokers only use broker.rack to spread replicas across racks
+RACK_SELECTOR_VERSION = (2, 4)
+RACK_SELECTOR = 'org.apache.kafka.common.replica.RackAwareReplicaSelector'
+
+MB = 1024*1024
+GB = 1024*MB
+
+# tuning per instance family, anything not listed uses the default profile
+# - networkThreadsPerCpu: network threads per vCPU (before the min/max)
+# - socketBufferBytes: socket send and receive buffer size
+PROFILES = {
+    'default': {'networkThreadsPerCpu': 0.5, 'socketBufferBytes': 1*MB},
+    # burstable instances have little memory and network to spare
+    't2': {'networkThreadsPerCpu': 0.5, 'socketBufferBytes': 100*1024},
+    't3': {'networkThreadsPerCpu': 0.5, 'socketBufferBytes': 100*1024},
+    # network optimised instances can keep a thread busy per vCPU
+    'c5n': {'networkThreadsPerCpu': 1.0, 'socketBufferBytes': 2*MB},
+    'm5n': {'networkThreadsPerCpu': 1.0, 'socketBufferBytes': 2*MB},
+    'r5n': {'networkThreadsPerCpu': 1.0, 'socketBufferBytes': 2*MB},
+    # storage optimised instances have many local disks to drive
+    'd2': {'networkThreadsPerCpu': 0.5, 'socketBufferBytes': 1*MB},
+    'i3': {'networkThreadsPerCpu': 0.5, 'socketBufferBytes': 1*MB}
+}
+
+def getProfile(instanceType):
+    family = instanceType.split('.', 1)[0]
+    profile = dict(PROFILES['default'])
+    profile.update(PROFILES.get(family, {}))
+    print('using the '+(family if family in PROFILES else 'default')+' profile for '+instanceType)
+    return profile
+
+def getCpuCount():
+    return multiprocessing.cpu_count()
+
+def getMemoryBytes():
+    with open('/proc/meminfo', 'r') as f:
+        for line in f:
+            if line.startswith('MemTotal:'):
+                return int(line.split()[1])*1024
+    raise Exception('MemTotal is missing from /proc/meminfo')
+
+def getDataDirs(root=DATA_ROOT):
+    # every mounted kafka data volume, e.g. /data/kafka or /data/kafka-1, /data/kafka-2, ...
+    dirs = []
+    if os.path.isdir(root):
+        for entry in sorted(os.listdir(root)):
+            path = os.path.join(root, entry)
+            if entry.startswith('kafka') and os.path.ismount(path):
+                dirs.append(path)
+    if not dirs:
+        dirs = [DEFAULT_LOG_DIR]
+    return dirs
+
+def getKafkaVersion(libs='/opt/kafka/libs'):
+    # the installed Kafka version from its jar, e.g. (0, 11, 0) for kafka_2.12-0.11.0.2.jar
+    for path in glob.glob(os.path.join(libs, 'kafka_*.jar')):
+        match = re.search(r'kafka_[\d.]+-(\d+)\.(\d+)\.(\d+)', os.path.basename(path))
+        if match is not None:
+            return tuple(int(part) for part in match.groups())
+    return (0, 0, 0)
+
+def getRackSettings(rack, kafkaVersion):
+    if rack is None:
+        return {}
+    if kafkaVersion < RACK_SELECTOR_VERSION:
+        print('Kafka '+'.'.join(str(part) for part in kafkaVersion)+' can only fetch from leaders, not from replicas in '+rack)
+        return {}
+    return {'replica.selector.class': RACK_SELECTOR}
+
+def clamp(value, lowest, highest):
+    return max(lowest, min(int(value), highest))
+
+def computeSettings(cpus, dataDirs, profile):
+    # derive the broker settings from the hardware, returning the server.properties values
+    disks = len(dataDirs)
+    settings = {
+        'num.network.threads': clamp(cpus*profile['networkThreadsPerCpu'], 3, 32),
+        # at least one IO thread per disk so every volume is kept busy
+        'num.io.threads': clamp(max(cpus, 2*disks), 8, 64),
+        'num.replica.fetchers': clamp(cpus/4, 1, 8),
+        'num.recovery.threads.per.data.dir': clamp(cpus/disks, 1, 8),
+        'socket.send.buffer.bytes': profile['socketBufferBytes'],
+        'socket.receive.buffer.bytes': profile['socketBufferBytes'],
+        'replica.socket.receive.buffer.bytes': profile['socketBufferBytes'],
+        'log.dirs': ','.join(dataDirs)
+    }
+
+    return settings
+
+def configure(overrides, path=SERVER_PROPERTIES):
+    # render server.properties for this instance, with the overrides (e.g. broker.id)
+    # applied on top in the same write
+    identity = instance_metadata.getIdentity()
+    profile = getProfile(identity.get('instanceType', ''))
+    cpus = getCpuCount()
+    memoryBytes = getMemoryBytes()
+    dataDirs = getDataDirs()
+    print('cpus: '+str(cpus)+' memory: '+str(memoryBytes // MB)+'MB data dirs: '+str(dataDirs))
+
+    settings = computeSettings(cpus, dataDirs, profile)
+    settings.update(getRackSettings(overrides.get('broker.rack'), getKafkaVersion()))
+    settings.update(overrides)
+    return properties_file.updateProperties(path, settings)
+
+if __name__ == "__main__":
+    # kafka_config.py [key=value ...] - the key=value pairs override the computed settings
+    overrides = {}
+    for arg in sys.argv[1:]:
+        key, value = arg.split('=', 1)
+        overrides[key] = value
+    configure(overrides)
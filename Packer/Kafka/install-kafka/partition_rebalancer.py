@@ -0,0 +1,310 @@
+import bisect
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import properties_file
+
+SERVER_PROPERTIES = '/opt/kafka/config/server.properties'
+REASSIGN_PARTITIONS = '/opt/kafka/bin/kafka-reassign-partitions.sh'
+PREFERRED_REPLICA_ELECTION = '/opt/kafka/bin/kafka-preferred-replica-election.sh'
+
+# the replication traffic each broker may use while partitions move, in bytes/s
+THROTTLE = int(os.environ.get('REBALANCE_THROTTLE', 50*1024*1024))
+VERIFY_INTERVAL = 30
+# how long to wait for a new broker to register, or another reassignment to finish
+WAIT_DEADLINE = 1800
+LEADER_PASSES = 10
+# how many times to plan again when another reassignment starts first
+REBALANCE_ATTEMPTS = 5
+# kafka-reassign-partitions.sh exits 0 even when it couldn't create the reassignment
+STARTED = 'Successfully started reassignment'
+
+# The planner works on an assignment dump of the form
+#   {"brokers": {"1": {"rack": "eu-west-1a"}, ...},
+#    "partitions": [{"topic": "t", "partition": 0, "replicas": [1, 2], "size": 1024}, ...]}
+# where rack and size are optional; without sizes every partition counts the same, so the
+# brokers end up with the same number of replicas rather than the same number of bytes.
+
+def getSize(partition):
+    return partition.get('size', 1)
+
+def getWeight(partition):
+    # what a replica adds to its broker's load, an empty partition still counts for a little
+    # so the empty partitions are spread out too
+    return max(getSize(partition), 1)
+
+def getRack(brokers, broker):
+    return brokers.get(str(broker), {}).get('rack')
+
+def canMove(partition, source, destination, brokers, allRacks):
+    # a replica can move to a broker without one, and to a different rack unless the
+    # partition is already in every rack
+    replicas = partition['replicas']
+    if destination in replicas:
+        return False
+    destinationRack = getRack(brokers, destination)
+    if destinationRack is None:
+        return True
+    otherRacks = set(getRack(brokers, broker) for broker in replicas if broker != source)
+    return destinationRack not in otherRacks or otherRacks >= allRacks
+
+def findReplica(hosted, cursors, partitions, donor, receiver, limit, brokers, allRacks):
+    # the position in the donor's replicas of the largest one weighing no more than limit
+    # that can go to the receiver, or None; each donor and receiver pair remembers where it
+    # got to, so replicas that can't go to the receiver aren't looked at again while the
+    # gap between the two shrinks
+    replicas = hosted[donor]
+    cursor = cursors.get((donor, receiver))
+    end = bisect.bisect_right(replicas, (limit, len(partitions)))
+    if cursor is not None and cursor[1] >= limit:
+        end = min(end, bisect.bisect_left(replicas, cursor[0]))
+    position = end
+    while position > 0:
+        position -= 1
+        weight, index = replicas[position]
+        if canMove(partitions[index], donor, receiver, brokers, allRacks):
+            cursors[(donor, receiver)] = [replicas[position], limit]
+            return position
+    cursors[(donor, receiver)] = [(0, -1), limit]
+    return None
+
+def balanceReplicas(partitions, brokers):
+    # move replicas from the most loaded brokers to the least loaded, by bytes when the
+    # partitions have sizes and by replica count when they don't, returning the number of
+    # replicas and bytes moved; each move takes the largest replica that is no more than
+    # half the gap between the two brokers, so every move narrows the spread and a new
+    # broker fills up with as few moves as possible
+    loads = dict((int(broker), 0) for broker in brokers)
+    hosted = dict((broker, []) for broker in loads)
+    for index, partition in enumerate(partitions):
+        for broker in partition['replicas']:
+            if broker in loads:
+                loads[broker] += getWeight(partition)
+                hosted[broker].append((getWeight(partition), index))
+    for broker in hosted:
+        hosted[broker].sort()
+    allRacks = set(getRack(brokers, broker) for broker in brokers)
+
+    cursors = {}
+    # the brokers that nothing more can be moved to
+    full = set()
+    moved = 0
+    movedBytes = 0
+    while len(full) < len(loads):
+        receiver = min((broker for broker in loads if broker not in full), key=lambda broker: (loads[broker], broker))
+        move = None
+        for donor in sorted(loads, key=lambda broker: (-loads[broker], broker)):
+            gap = loads[donor] - loads[receiver]
+            if gap < 2:
+                break
+            position = findReplica(hosted, cursors, partitions, donor, receiver, gap // 2, brokers, allRacks)
+            if position is not None:
+                move = [donor, position]
+                break
+        if move is None:
+            full.add(receiver)
+            continue
+
+        donor, position = move
+        weight, index = hosted[donor].pop(position)
+        bisect.insort(hosted[receiver], (weight, index))
+        replicas = partitions[index]['replicas']
+        replicas[replicas.index(donor)] = receiver
+        loads[donor] -= weight
+        loads[receiver] += weight
+        moved += 1
+        movedBytes += getSize(partitions[index])
+
+    return [moved, movedBytes]
+
+def balanceLeaders(partitions, brokers):
+    # even out the preferred leaders by reordering each partition's replicas, which moves
+    # no data; returns the number of partitions whose leader changed
+    leaders = dict((int(broker), 0) for broker in brokers)
+    for partition in partitions:
+        if partition['replicas'] and partition['replicas'][0] in leaders:
+            leaders[partition['replicas'][0]] += 1
+    if not leaders:
+        return 0
+    ceiling = -(-sum(leaders.values()) // len(leaders))
+
+    changed = set()
+    for attempt in range(LEADER_PASSES):
+        swaps = 0
+        for index, partition in enumerate(partitions):
+            replicas = partition['replicas']
+            if not replicas or replicas[0] not in leaders:
+                continue
+            leader = replicas[0]
+            if leaders[leader] <= ceiling - 1:
+                continue
+            candidates = [broker for broker in replicas[1:] if broker in leaders and leaders[broker] < leaders[leader] - 1]
+            if not candidates:
+                continue
+            follower = min(candidates, key=lambda broker: (leaders[broker], broker))
+            position = replicas.index(follower)
+            replicas[0], replicas[position] = follower, leader
+            leaders[leader] -= 1
+            leaders[follower] += 1
+            changed.add(index)
+            swaps += 1
+        if swaps == 0:
+            break
+    return len(changed)
+
+def plan(dump):
+    # compute the reassignment for an assignment dump, returning the
+    # kafka-reassign-partitions plan and a summary of what it moves
+    started = time.time()
+    brokers = dump['brokers']
+    partitions = [dict(p, replicas=list(p['replicas'])) for p in dump['partitions']]
+    moved, movedBytes = balanceReplicas(partitions, brokers)
+    leaders = balanceLeaders(partitions, brokers)
+
+    changes = []
+    for before, after in zip(dump['partitions'], partitions):
+        if before['replicas'] != after['replicas']:
+            changes.append({'topic':after['topic'], 'partition':after['partition'], 'replicas':after['replicas']})
+    summary = {
+        'partitions': len(partitions),
+        'brokers': len(brokers),
+        'replicas_moved': moved,
+        'bytes_moved': movedBytes,
+        'leaders_moved': leaders,
+        'plan_seconds': round(time.time() - started, 3)
+    }
+    return [{'version':1, 'partitions':changes}, summary]
+
+def getPlanMetric(summary):
+    # the metric line for a plan; printed by rebalance, and kept off stdout by the plan
+    # command so its output stays a plan kafka-reassign-partitions can read
+    return 'metric rebalance_plan '+' '.join(key+'='+str(summary[key]) for key in sorted(summary))
+
+def getZookeeperConnect(path=SERVER_PROPERTIES):
+    return properties_file.readProperties(path)['zookeeper.connect']
+
+def connect(zookeeperConnect):
+    # kazoo is only needed against a live cluster, so plans can be made without it
+    from kazoo.client import KazooClient
+    zk = KazooClient(hosts=zookeeperConnect, read_only=True)
+    zk.start(timeout=30)
+    return zk
+
+def dumpAssignments(zk):
+    # read the live brokers and every partition's replicas from the cluster's znodes
+    brokers = {}
+    for broker in zk.get_children('/brokers/ids'):
+        registration = json.loads(zk.get('/brokers/ids/'+broker)[0].decode('utf-8'))
+        brokers[broker] = {'rack': registration.get('rack')}
+    partitions = []
+    for topic in sorted(zk.get_children('/brokers/topics')):
+        assignment = json.loads(zk.get('/brokers/topics/'+topic)[0].decode('utf-8'))['partitions']
+        for partition in sorted(assignment, key=int):
+            partitions.append({'topic':topic, 'partition':int(partition), 'replicas':assignment[partition]})
+    return {'brokers':brokers, 'partitions':partitions}
+
+def waitFor(description, check, deadline=WAIT_DEADLINE):
+    started = time.time()
+    while not check():
+        if time.time() - started > deadline:
+            raise Exception('gave up waiting: '+description)
+        time.sleep(VERIFY_INTERVAL)
+    print(description+' after '+('%.0f' % (time.time() - started))+'s')
+
+def runTool(args):
+    print('running: '+' '.join(args))
+    output = subprocess.check_output(args).decode('utf-8')
+    print(output)
+    return output
+
+def execute(zookeeperConnect, reassignment, throttle=THROTTLE):
+    # run the plan with a replication throttle, reporting progress until every partition
+    # has moved, returning whether they all moved or None if another reassignment started
+    # first; the final --verify removes the throttle
+    fd, path = tempfile.mkstemp(prefix='reassignment-', suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(reassignment, f)
+    base = [REASSIGN_PARTITIONS, '--zookeeper', zookeeperConnect, '--reassignment-json-file', path]
+    started = time.time()
+    # the tool starts the reassignment by creating /admin/reassign_partitions, which fails
+    # if the node exists, so only one reassignment can win however close together they start
+    if STARTED not in runTool(base+['--execute', '--throttle', str(throttle)]):
+        os.unlink(path)
+        return None
+
+    total = len(reassignment['partitions'])
+    while True:
+        output = runTool(base+['--verify'])
+        remaining = output.count('is still in progress')
+        failed = output.count('failed')
+        print('metric rebalance_progress completed='+str(total - remaining - failed)+' remaining='+str(remaining)+
+              ' failed='+str(failed)+' seconds='+('%.0f' % (time.time() - started)))
+        if remaining == 0:
+            break
+        time.sleep(VERIFY_INTERVAL)
+
+    # move leadership to the new preferred leaders
+    with open(path, 'w') as f:
+        json.dump({'partitions':[{'topic':p['topic'], 'partition':p['partition']} for p in reassignment['partitions']]}, f)
+    runTool([PREFERRED_REPLICA_ELECTION, '--zookeeper', zookeeperConnect, '--path-to-json-file', path])
+    os.unlink(path)
+    return failed == 0
+
+def getReplicaCount(dump, brokerId):
+    return len([p for p in dump['partitions'] if int(brokerId) in p['replicas']])
+
+def rebalance(brokerId=None, throttle=THROTTLE):
+    # rebalance the live cluster, first waiting for the given new broker to register
+    zookeeperConnect = getZookeeperConnect()
+    for attempt in range(REBALANCE_ATTEMPTS):
+        zk = connect(zookeeperConnect)
+        try:
+            if brokerId is not None:
+                waitFor('broker '+str(brokerId)+' registered', lambda: zk.exists('/brokers/ids/'+str(brokerId)) is not None)
+            waitFor('no reassignment in progress', lambda: zk.exists('/admin/reassign_partitions') is None)
+            dump = dumpAssignments(zk)
+        finally:
+            zk.stop()
+
+        # a broker that already holds replicas is replacing one, e.g. on a slot recorded
+        # before broker.ids were, so it isn't new
+        if brokerId is not None and attempt == 0 and getReplicaCount(dump, brokerId) > 0:
+            print('broker '+str(brokerId)+' already holds '+str(getReplicaCount(dump, brokerId))+' replicas, leaving the partitions as they are')
+            return True
+
+        reassignment, summary = plan(dump)
+        print(getPlanMetric(summary))
+        if not reassignment['partitions']:
+            print('the partitions are already balanced across '+str(summary['brokers'])+' brokers')
+            return True
+        result = execute(zookeeperConnect, reassignment, throttle)
+        if result is not None:
+            return result
+        # another reassignment created the node first, so plan again once it has finished
+        print('another reassignment started first, planning again once it has finished')
+    raise Exception('unable to start a reassignment after '+str(REBALANCE_ATTEMPTS)+' attempts')
+
+if __name__ == "__main__":
+    # partition_rebalancer.py dump
+    # partition_rebalancer.py plan <assignment dump file>
+    # partition_rebalancer.py rebalance [new broker id]
+    if len(sys.argv) < 2 or sys.argv[1] not in ['dump', 'plan', 'rebalance'] or (sys.argv[1] == 'plan' and len(sys.argv) != 3):
+        print("Usage: "+sys.argv[0]+" dump | plan <assignment dump file> | rebalance [new broker id]")
+        sys.exit(1)
+
+    if sys.argv[1] == 'dump':
+        zk = connect(getZookeeperConnect())
+        try:
+            print(json.dumps(dumpAssignments(zk)))
+        finally:
+            zk.stop()
+    elif sys.argv[1] == 'plan':
+        with open(sys.argv[2], 'r') as f:
+            reassignment, summary = plan(json.load(f))
+        sys.stderr.write(getPlanMetric(summary)+'\n')
+        print(json.dumps(reassignment))
+    else:
+        sys.exit(0 if rebalance(sys.argv[2] if len(sys.argv) > 2 else None) else 1)
@@ -0,0 +1,88 @@
+import os
+import subprocess
+import sys
+import atomic_file
+
+def parseKey(line):
+    # the key of a "key=value" line, or None for comments and blanks
+    stripped = line.strip()
+    if stripped == '' or stripped[0] in '#!' or '=' not in stripped:
+        return None
+    return stripped.split('=', 1)[0].strip()
+
+def applyProperties(lines, properties):
+    # set every key in the properties dict in a single pass, replacing the first
+    # line for a key in place, dropping any duplicates and appending new keys,
+    # returning the new lines and the sorted list of keys whose value changed
+    newLines = []
+    seen = set()
+    changed = set()
+    for line in lines:
+        key = parseKey(line)
+        if key is None or key not in properties:
+            newLines.append(line)
+            continue
+
+        if key in seen:
+            changed.add(key)
+            continue
+        seen.add(key)
+
+        newLine = key+'='+str(properties[key])+'\n'
+        if line.rstrip('\n') != newLine.rstrip('\n'):
+            changed.add(key)
+        newLines.append(newLine)
+
+    if newLines and not newLines[-1].endswith('\n'):
+        newLines[-1] = newLines[-1]+'\n'
+    for key in sorted(properties):
+        if key not in seen:
+            newLines.append(key+'='+str(properties[key])+'\n')
+            changed.add(key)
+
+    return [newLines, sorted(changed)]
+
+def updateProperties(path, properties):
+    # bring the properties file in line with the dict, writing only if something changed
+    lines = []
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            lines = f.readlines()
+
+    retvals = applyProperties(lines, properties)
+    changed = retvals[1]
+    if changed:
+        for key in changed:
+            print(path+': '+key+'='+str(properties[key]))
+        atomic_file.writeAtomically(path, retvals[0])
+    else:
+        print(path+' is already up to date')
+    return changed
+
+def readProperties(path):
+    properties = {}
+    with open(path, 'r') as f:
+        for line in f:
+            key = parseKey(line)
+            if key is not None and key not in properties:
+                properties[key] = line.split('=', 1)[1].strip()
+    return properties
+
+def sudoUpdateProperties(path, properties):
+    # run this script once under sudo to apply the properties, e.g. to a root owned file
+    args = ['sudo', sys.executable, os.path.abspath(__file__), path]
+    for key in sorted(properties):
+        args.append(key+'='+str(properties[key]))
+    print(subprocess.check_output(args).decode('utf-8'))
+
+if __name__ == "__main__":
+    # properties_file.py <file> key=value [key=value ...]
+    if len(sys.argv) < 3:
+        print("Usage: "+sys.argv[0]+" <file> key=value [key=value ...]")
+        sys.exit(1)
+
+    properties = {}
+    for arg in sys.argv[2:]:
+        key, value = arg.split('=', 1)
+        properties[key] = value
+    updateProperties(sys.argv[1], properties)
@@ -1,57 +1,90 @@
+import os
+import re
 import sys
-import fileinput
+import atomic_file
 
-def replaceAll(file,searchExp,replaceExp):
+def lastToken(expression):
+    # the trailing word of an expression, e.g. the host name in "0.0.0.0 kafka1"
+    parts = expression.rsplit(None, 1)
+    if not parts:
+        return ''
+    return parts[-1]
 
-    print('file being changed is: '+str(file))
-    print('expression being changed is: '+str(searchExp))
-    print('expression to be changed to is: '+str(replaceExp))
+def replaceLines(lines, pairs):
+    # apply a batch of (search, replace) pairs to the lines in a single pass:
+    # - every occurrence of a search expression found in the file is replaced
+    # - for a search expression that isn't in the file, a line that ends with the
+    #   same trailing word (i.e. has been changed before) is overwritten instead; pairs
+    #   sharing a trailing word take the lines ending with it in turn
+    # - anything still not found is appended, in the order given
+    # returns the new lines and whether anything changed
+    content = ''.join(lines)
+    present = set()
+    fallback = {}
+    for searchExp, replaceExp in pairs:
+        if searchExp in content:
+            present.add(searchExp)
+        else:
+            fallback.setdefault(lastToken(searchExp), []).append(replaceExp)
 
-    # read in all the lines for prelim check
-    tempfile = open(file, 'r')
-    lines = tempfile.readlines()
-    tempfile.close()
+    replacements = {}
+    for searchExp, replaceExp in pairs:
+        if searchExp in present:
+            replacements[searchExp] = replaceExp
 
-    found = False
+    # longest first so that overlapping expressions match the most specific one
+    matcher = None
+    if replacements:
+        matcher = re.compile('|'.join(re.escape(s) for s in sorted(replacements, key=len, reverse=True)))
 
-    # process the lines that need amending
+    newLines = []
     for line in lines:
-        if str(searchExp) in line:
-            print('about to change initial expression')
-            for line in fileinput.input(file, inplace=True):
-                print(line.rstrip().replace(searchExp, replaceExp))
-            found = True
-
-    # process the lines that need adding
-    # firstly make sure that the line hasn't been changed before
-    # if it has then change the search criteria and overwrite it
-    # if it hasn't then insert a new line
-    if not found:
-        for line in lines:
-            try:
-                print('line is: '+line)
-                print('modified search is: '+str(searchExp.rsplit(None, 1)[-1]))
-                # if this  has been changed before then overwrite it
-                if str(searchExp.rsplit(None, 1)[-1]) in line:
-                    print('about to change old expression')
-                    searchExp = str(line.rsplit(None, 1)[0])+' '+str(searchExp.rsplit(None, 1)[-1])
-                    print('new searchExp is: '+searchExp)
-                    for l in fileinput.input(file, inplace=True):
-                        print(l.rstrip().replace(searchExp, replaceExp))
-                    found = True
-            except Exception as e:
-                found = True
-                print(str(e))
-
-        # only insert totally new lines
-        if not found:
-            print('about to insert expression')
-            ectHosts = open(file, 'a')
-            ectHosts.write(str(replaceExp)+"\n")
-            ectHosts.close()
+        newLine = line
+        if matcher is not None:
+            newLine = matcher.sub(lambda m: replacements[m.group(0)], line)
+        if fallback and newLine == line:
+            token = lastToken(line)
+            if fallback.get(token):
+                ending = '\n' if line.endswith('\n') else ''
+                newLine = fallback[token].pop(0)+ending
+        newLines.append(newLine)
+
+    # only insert totally new lines
+    for searchExp, replaceExp in pairs:
+        pending = fallback.get(lastToken(searchExp), [])
+        if searchExp not in present and replaceExp in pending:
+            pending.remove(replaceExp)
+            if newLines and not newLines[-1].endswith('\n'):
+                newLines[-1] = newLines[-1]+'\n'
+            newLines.append(replaceExp+'\n')
+
+    return [newLines, newLines != lines]
+
+def replaceAllPairs(file, pairs):
+    print('file being changed is: '+str(file))
+    for searchExp, replaceExp in pairs:
+        print('expression '+str(searchExp)+' to be changed to: '+str(replaceExp))
+
+    with open(file, 'r') as f:
+        lines = f.readlines()
+
+    retvals = replaceLines(lines, pairs)
+    if retvals[1]:
+        atomic_file.writeAtomically(file, retvals[0])
+    else:
+        print('no changes needed to '+str(file))
+    return retvals[1]
+
+def replaceAll(file,searchExp,replaceExp):
+    return replaceAllPairs(file, [(searchExp, replaceExp)])
 
 if __name__ == "__main__":
     print("This is the name of the script: ", sys.argv[0])
     print("Number of arguments: ", len(sys.argv))
     print("The arguments are: " , str(sys.argv))
-    replaceAll(sys.argv[1],sys.argv[2],sys.argv[3])
\ No newline at end of file
+    # replaceAll.py <file> <search> <replace> [<search> <replace> ...]
+    if len(sys.argv) < 4 or len(sys.argv) % 2 != 0:
+        print("Usage: "+sys.argv[0]+" <file> <search> <replace> [<search> <replace> ...]")
+        sys.exit(1)
+    args = sys.argv[2:]
+    replaceAllPairs(sys.argv[1], list(zip(args[0::2], args[1::2])))
@@ -0,0 +1,170 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import boto3
+import botocore
+import ssh_fanout
+
+# The lease is an item in the kafka-state table so that only one node at a time
+# can be bouncing brokers, even if several replacements happen together.
+TABLE_NAME = 'kafka-state'
+LEASE_KEY = {'cluster': {'S':'kafka'}, 'slot': {'S':'restart-lease'}}
+
+SERVER_PROPERTIES = '/opt/kafka/config/server.properties'
+# the peers conf_kafka found need a restart, which waits until the local broker is up
+PENDING_FILE = '/tmp/install-kafka/pending_restarts.json'
+KEY_FILE = '/tmp/install-kafka/<your .pem file>'
+KAFKA_TOPICS = '/opt/kafka/bin/kafka-topics.sh'
+KAFKA_PORT = 9092
+
+# how long to wait for each step of a broker restart
+LEASE_WAIT = 900
+BROKER_WAIT = 300
+REPLICATION_WAIT = 1800
+# the lease is renewed on every poll, and outlasts the longest wait in case a renewal is slow
+LEASE_SECONDS = REPLICATION_WAIT + BROKER_WAIT
+
+def acquireLease(client, owner, seconds=LEASE_SECONDS):
+    # take (or renew) the restart lease, returning False if another node holds it
+    now = int(time.time())
+    try:
+        client.update_item(
+            Key=LEASE_KEY,
+            TableName=TABLE_NAME,
+            UpdateExpression='SET lease_owner = :owner, expires = :expires',
+            ConditionExpression='attribute_not_exists(lease_owner) OR lease_owner = :owner OR expires < :now',
+            ExpressionAttributeValues={
+                ':owner': {'S':owner},
+                ':expires': {'N':str(now+seconds)},
+                ':now': {'N':str(now)}
+            }
+        )
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+    return True
+
+def releaseLease(client, owner):
+    try:
+        client.delete_item(
+            Key=LEASE_KEY,
+            TableName=TABLE_NAME,
+            ConditionExpression='lease_owner = :owner',
+            ExpressionAttributeValues={':owner': {'S':owner}}
+        )
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+def waitFor(description, check, deadline, initialDelay=1, maxDelay=15, renew=None):
+    # poll check() with backoff until it returns True or the deadline passes, calling
+    # renew() before each poll and giving up if it returns False
+    started = time.time()
+    delay = initialDelay
+    while True:
+        if renew is not None and not renew():
+            raise Exception('lost the kafka restart lease while waiting: '+description)
+        if check():
+            print(description+' after '+('%.1f' % (time.time() - started))+'s')
+            return True
+        if time.time() - started > deadline:
+            print('gave up waiting: '+description)
+            return False
+        time.sleep(delay)
+        delay = min(delay*2, maxDelay)
+
+def getZookeeperConnect():
+    with open(SERVER_PROPERTIES, 'r') as f:
+        for line in f:
+            if line.startswith('zookeeper.connect='):
+                return line.split('=', 1)[1].strip()
+    raise Exception('zookeeper.connect is not set in '+SERVER_PROPERTIES)
+
+def getUnderReplicatedCount(zookeeperConnect):
+    # count the under-replicated partitions reported by the admin tool
+    output = subprocess.check_output([KAFKA_TOPICS, '--describe', '--under-replicated-partitions',
+                                      '--zookeeper', zookeeperConnect]).decode('utf-8')
+    count = len([line for line in output.splitlines() if line.strip() != ''])
+    print('under-replicated partitions: '+str(count))
+    return count
+
+def isListening(address, port=KAFKA_PORT):
+    try:
+        socket.create_connection((address, port), 5).close()
+        return True
+    except socket.error:
+        return False
+
+def rollingRestart(client, brokers, keyFile, owner, zookeeperConnect=None, getUrp=None):
+    # restart the brokers (a dict of name -> IP) one at a time, waiting for the
+    # cluster to be fully replicated before moving on to the next one
+    if not brokers:
+        return []
+    if getUrp is None:
+        if zookeeperConnect is None:
+            zookeeperConnect = getZookeeperConnect()
+        getUrp = lambda: getUnderReplicatedCount(zookeeperConnect)
+
+    if not waitFor('acquired the restart lease', lambda: acquireLease(client, owner), LEASE_WAIT):
+        raise Exception('unable to acquire the kafka restart lease')
+
+    renew = lambda: acquireLease(client, owner)
+    failed = []
+    try:
+        # don't make things worse by restarting into an already degraded cluster
+        if not waitFor('cluster fully replicated', lambda: getUrp() == 0, REPLICATION_WAIT, renew=renew):
+            raise Exception('the cluster has under-replicated partitions, not restarting')
+
+        for name in sorted(brokers):
+            if not renew():
+                raise Exception('lost the kafka restart lease, stopping the rolling restart before '+name)
+            print('restarting kafka on '+name)
+            started = time.time()
+            results = ssh_fanout.runOnHosts({name:brokers[name]}, "sudo su ec2-user -c 'sudo service kafka restart'", keyFile)
+            if ssh_fanout.getFailures(results):
+                failed.append(name)
+                raise Exception('restarting kafka on '+name+' failed, stopping the rolling restart')
+
+            ready = waitFor(name+' is accepting connections', lambda: isListening(brokers[name]), BROKER_WAIT, renew=renew)
+            ready = ready and waitFor('cluster fully replicated', lambda: getUrp() == 0, REPLICATION_WAIT, renew=renew)
+            print('metric broker_restart host='+name+' seconds='+('%.1f' % (time.time() - started)))
+            if not ready:
+                failed.append(name)
+                raise Exception(name+' did not rejoin the ISR, stopping the rolling restart')
+    finally:
+        releaseLease(client, owner)
+
+    return failed
+
+def savePending(brokers, owner, path=PENDING_FILE):
+    # leave the restarts for after the local broker has started, since until then its
+    # own partitions are under-replicated and the restarts would never be allowed to go
+    with open(path, 'w') as f:
+        json.dump({'owner':owner, 'brokers':brokers}, f)
+
+def runPending(client, path=PENDING_FILE):
+    if not os.path.exists(path):
+        print('there are no pending broker restarts')
+        return []
+    with open(path, 'r') as f:
+        pending = json.load(f)
+    failed = rollingRestart(client, pending['brokers'], KEY_FILE, pending['owner'])
+    os.unlink(path)
+    return failed
+
+if __name__ == "__main__":
+    # rolling_restart.py pending | name=ip [name=ip ...]
+    session = boto3.Session(profile_name='terraform')
+    client = session.client('dynamodb')
+    if sys.argv[1:] == ['pending']:
+        runPending(client)
+        sys.exit(0)
+    brokers = {}
+    for arg in sys.argv[1:]:
+        name, ip = arg.split('=', 1)
+        brokers[name] = ip
+    rollingRestart(client, brokers, KEY_FILE, socket.gethostname())
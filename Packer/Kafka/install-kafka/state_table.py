@@ -0,0 +1,169 @@
+import random
+import time
+import botocore
+import slot_allocator
+import tag_lookup
+
+# Each *-state table holds one item per node slot:
+#   cluster (partition key) - e.g. kafka
+#   slot    (sort key)      - e.g. kafka3
+#   ip                      - the IP of the node holding the slot
+#   instance                - the instance ID of the node holding the slot
+# so reading a cluster is a single Query and claims on different slots never conflict.
+
+# the IP recorded against a slot that no node holds
+FREE_IP = '0.0.0.0'
+
+# how many times to re-read the state when another node takes the slot we wanted
+MAX_CLAIM_ATTEMPTS = 10
+# how long to back off between attempts, with full jitter so nodes that lost the
+# same race don't all retry together
+CLAIM_INITIAL_DELAY = 0.2
+CLAIM_MAX_DELAY = 5
+
+def getState(client, tablename, cluster):
+    # read every slot item for the cluster, returning a dict of slot -> item
+    state = {}
+    paginator = client.get_paginator('query')
+    pages = paginator.paginate(
+        TableName=tablename,
+        KeyConditionExpression='#cluster = :cluster',
+        ExpressionAttributeNames={'#cluster':'cluster'},
+        ExpressionAttributeValues={':cluster': {'S':cluster}},
+        ConsistentRead=True
+    )
+    for page in pages:
+        for item in page['Items']:
+            state[item['slot']['S']] = item
+
+    print('the state stored in the dynamodb table is: '+str(state))
+    return state
+
+def getSlotIp(state, slot):
+    return state.get(slot, {}).get('ip', {}).get('S', FREE_IP)
+
+def getIps(client, tablename, cluster):
+    # return a dict of slot -> IP for the cluster
+    state = getState(client, tablename, cluster)
+    ips = {}
+    for slot in state:
+        ips[slot] = getSlotIp(state, slot)
+    return ips
+
+def updateSlot(client, tablename, cluster, slot, ip, condition=None, values=None, instanceId=None):
+    # write this node's IP into its slot item in one conditional UpdateItem, returning
+    # the new item, or None if the condition failed because another node won
+    attributevalues = {
+        ':ip': {'S':ip}
+    }
+    expression = 'SET ip = :ip'
+    if instanceId is not None:
+        attributevalues[':instance'] = {'S':instanceId}
+        expression = expression+', instance = :instance'
+    if values is not None:
+        attributevalues.update(values)
+
+    kwargs = {}
+    if condition is not None:
+        kwargs['ConditionExpression'] = condition
+
+    try:
+        response = client.update_item(
+            Key={
+                'cluster': {'S':cluster},
+                'slot': {'S':slot}
+            },
+            TableName=tablename,
+            UpdateExpression=expression,
+            ExpressionAttributeValues=attributevalues,
+            ReturnValues='ALL_NEW',
+            **kwargs
+        )
+    except botocore.exceptions.ClientError as e:
+        # Ignore the ConditionalCheckFailedException, bubble up
+        # other exceptions.
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        print('slot '+slot+' was claimed by another node')
+        return None
+
+    return response['Attributes']
+
+def claimSlot(client, tablename, cluster, maxinstances, ip, findSlots, instanceId=None, sleep=time.sleep):
+    # atomically claim a free slot for this node, or if every slot is held then take over
+    # the slot of a node this one is replacing; findSlots returns the dict of ASG instance
+    # id -> slot number from their Name tags
+    seed = instanceId if instanceId is not None else ip
+    attempt = 0
+    while attempt < MAX_CLAIM_ATTEMPTS:
+        if attempt > 0:
+            delay = random.uniform(0, min(CLAIM_MAX_DELAY, CLAIM_INITIAL_DELAY * (2 ** attempt)))
+            print('every slot tried was taken, retrying in '+('%.2f' % delay)+'s')
+            sleep(delay)
+        attempt += 1
+        state = getState(client, tablename, cluster)
+
+        # if this node already holds a slot (e.g. the script is being re-run) keep it
+        for slot in state:
+            if getSlotIp(state, slot) == ip and tag_lookup.getSlotNumber(slot, cluster) is not None:
+                print('this node already holds '+slot)
+                return [slot, state]
+
+        # try each free slot in turn, a failed condition means another node
+        # launched at the same time took it
+        slots = findSlots()
+        free = slot_allocator.getFreeSlots(state, cluster, maxinstances, FREE_IP)
+        for number in slot_allocator.spreadOrder(free, seed, slot_allocator.getLaunching(slots)):
+            slot = cluster+str(number)
+            item = updateSlot(client, tablename, cluster, slot, ip,
+                              'attribute_not_exists(ip) OR ip = :free',
+                              {':free': {'S':FREE_IP}}, instanceId)
+            if item is not None:
+                print('claimed free slot '+slot)
+                state[slot] = item
+                return [slot, state]
+
+        # the ASG is full, so some nodes have died and this one replaces one of them;
+        # only take a slot if it still holds the dead node's IP
+        for number in slot_allocator.spreadOrder(slot_allocator.getMissingSlots(slots, state, cluster, maxinstances), seed):
+            slot = cluster+str(number)
+            if getSlotIp(state, slot) == FREE_IP:
+                continue
+            item = updateSlot(client, tablename, cluster, slot, ip,
+                              'ip = :old',
+                              {':old': {'S':getSlotIp(state, slot)}}, instanceId)
+            if item is not None:
+                print('claimed replaced slot '+slot)
+                state[slot] = item
+                return [slot, state]
+
+    raise Exception("unable to claim a slot in the "+tablename+" table")
+
+def recordSlot(client, tablename, cluster, slot, ip, instanceId=None):
+    # the node already owns its slot, so just record its current IP
+    state = getState(client, tablename, cluster)
+    state[slot] = updateSlot(client, tablename, cluster, slot, ip, instanceId=instanceId)
+    return [slot, state]
+
+def setSlotAttributes(client, tablename, cluster, slot, attributes):
+    # record extra details (a dict of name -> typed DynamoDB value) against a slot
+    names = {}
+    values = {}
+    assignments = []
+    for index, name in enumerate(sorted(attributes)):
+        names['#a'+str(index)] = name
+        values[':a'+str(index)] = attributes[name]
+        assignments.append('#a'+str(index)+' = :a'+str(index))
+
+    response = client.update_item(
+        Key={
+            'cluster': {'S':cluster},
+            'slot': {'S':slot}
+        },
+        TableName=tablename,
+        UpdateExpression='SET '+', '.join(assignments),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+        ReturnValues='ALL_NEW'
+    )
+    return response['Attributes']
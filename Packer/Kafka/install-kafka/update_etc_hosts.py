@@ -1,49 +1,51 @@
 import json
 import boto3
+import state_table
+import hosts_file
+import instance_metadata
 import botocore
 import subprocess
 import sys
 
-def updateHosts(kmaxInstances, zkmaxInstances):
-
-    session = boto3.Session(profile_name='terraform')
-    dynamodb = session.resource('dynamodb')
-    ktable = dynamodb.Table('kafka-state')
-    zktable = dynamodb.Table('zookeeper-state')
-
-    try:
-        response = ktable.get_item(
-            Key={
-                'state_name': 'kafka'
-            }
-        )
-        print('the dynamodb response is: '+str(response))
-        kdata = response['Item']
-        print('the state stored in the dynamodb table is: '+str(kdata))
-    except Exception as e:
-        print('the exception is: '+str(e))
-        if str(e) == '\'Item\'':
-            print('there is no item the first time the table is read, ignore')
-        else:
-            raise e
+# restart modes:
+#   auto   - restart kafka only if an entry it resolves once at startup changed
+#   never  - never restart, kafka re-resolves peer brokers itself (see kafka_service)
+#   always - restart kafka on every update
+#   report - don't restart, but print RESTART_REQUIRED if auto would have restarted
+RESTART_MODES = ['auto', 'never', 'always', 'report']
+SERVER_PROPERTIES = '/opt/kafka/config/server.properties'
+
+def getBrokerName():
+    # this broker's own host name, taken from its advertised listener
+    with open(SERVER_PROPERTIES, 'r') as f:
+        for line in f:
+            if line.startswith('advertised.listeners='):
+                return line.split('://', 1)[1].split(':', 1)[0]
+    return None
+
+def needsRestart(changed):
+    # the zookeeper client resolves the ensemble once when the broker starts, and
+    # a change to the broker's own entry means its advertised address moved; peer
+    # broker entries are re-resolved by the JVM once the DNS cache expires
+    brokerName = getBrokerName()
+    for name in changed:
+        if name.startswith('zookeeper') or name == brokerName:
+            print('the entry for '+name+' changed, kafka needs restarting')
+            return True
+    return False
+
+def updateHosts(kmaxInstances, zkmaxInstances, restartMode='auto'):
+
+    # reuse the cached identity document rather than querying the metadata service again
+    region = instance_metadata.getIdentity()['region']
+    session = boto3.Session(profile_name='terraform', region_name=region)
+    client = session.client('dynamodb')
+
+    kdata = state_table.getIps(client, 'kafka-state', 'kafka')
 
     print (kdata)
 
-    try:
-        response = zktable.get_item(
-            Key={
-                'state_name': 'zookeeper'
-            }
-        )
-        print('the dynamodb response is: '+str(response))
-        zkdata = response['Item']
-        print('the state stored in the dynamodb table is: '+str(zkdata))
-    except Exception as e:
-        print('the exception is: '+str(e))
-        if str(e) == '\'Item\'':
-            print('there is no item the first time the table is read, ignore')
-        else:
-            raise e
+    zkdata = state_table.getIps(client, 'zookeeper-state', 'zookeeper')
 
     print (zkdata)
 
@@ -82,37 +84,43 @@ def updateHosts(kmaxInstances, zkmaxInstances):
     # zkdata = json.load(open(zkpath+zkfilename,'r'))
     # print (zkdata)
 
-    # stop kafka
-    subprocess.check_output("sudo su ec2-user -c 'sudo service kafka stop'", shell=True, executable='/bin/bash')
-
     # Update the /etc/hosts file
     # Add hosts entries (mocking DNS) - put relevant IPs here
+    # build the full set of entries so /etc/hosts is rewritten at most once
+    hosts = {}
+
     #update the kafka IP's
     index = 0
     print('the max kafka instances is: '+str(kmaxInstances))
     while index < int(kmaxInstances):
-        try:
-            index += 1
-            print('kafka'+str(index))
-            print("sudo python /tmp/install-kafka/replaceAll.py /etc/hosts \'0.0.0.0 kafka"+str(index)+"\' \'"+kdata['kafka'+str(index)]+" kafka"+str(index)+"\'")
-            subprocess.check_output("sudo python /tmp/install-kafka/replaceAll.py /etc/hosts \'0.0.0.0 kafka"+str(index)+"\' \'"+kdata['kafka'+str(index)]+" kafka"+str(index)+"\'", shell=True, executable='/bin/bash')
-        except Exception as e:
-            print(e)
-            raise e
+        index += 1
+        hosts['kafka'+str(index)] = kdata.get('kafka'+str(index), '0.0.0.0')
 
     #update the zookeeper IP's
     index = 0
     print('the max zookeeper instances is: '+str(zkmaxInstances))
     while index < int(zkmaxInstances):
         index += 1
-        print(index, zkdata['zookeeper'+str(index)])
-        subprocess.check_output("sudo python /tmp/install-kafka/replaceAll.py /etc/hosts \"0.0.0.0 zookeeper"+str(index)+"\" \""+zkdata['zookeeper'+str(index)]+" zookeeper"+str(index)+"\"", shell=True, executable='/bin/bash')
+        hosts['zookeeper'+str(index)] = zkdata.get('zookeeper'+str(index), '0.0.0.0')
+
+    changed = hosts_file.sudoUpdateHostsFile(hosts)
 
-    # start kafka
-    subprocess.check_output("sudo su ec2-user -c 'sudo service kafka start'", shell=True, executable='/bin/bash')
+    # only bounce the broker when its own resolution actually changed
+    if restartMode == 'always' or (restartMode == 'auto' and needsRestart(changed)):
+        subprocess.check_output("sudo su ec2-user -c 'sudo service kafka restart'", shell=True, executable='/bin/bash')
+    elif restartMode == 'report' and needsRestart(changed):
+        print('RESTART_REQUIRED')
+    else:
+        print('not restarting kafka')
 
 if __name__ == "__main__":
     print("This is the name of the script: ", sys.argv[0])
     print("Number of arguments: ", len(sys.argv))
     print("The arguments are: " , str(sys.argv))
-    updateHosts(sys.argv[1],sys.argv[2])
\ No newline at end of file
+    restartMode = 'auto'
+    if len(sys.argv) > 3:
+        restartMode = sys.argv[3]
+    if restartMode not in RESTART_MODES:
+        print("Usage: "+sys.argv[0]+" <kafka max> <zookeeper max> ["+'|'.join(RESTART_MODES)+"]")
+        sys.exit(1)
+    updateHosts(sys.argv[1],sys.argv[2],restartMode)
\ No newline at end of file
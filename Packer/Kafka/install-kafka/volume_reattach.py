@@ -0,0 +1,149 @@
+import os
+import subprocess
+import time
+import botocore
+
+# the broker's data volume, as set up by install-kafka-part1.sh
+DATA_DEVICE = '/dev/xvdf'
+DATA_MOUNT = '/data/kafka'
+
+VOLUME_WAIT = 300
+DEVICE_WAIT = 120
+
+def runLocal(command):
+    print('running: '+' '.join(command))
+    subprocess.check_call(command)
+
+def waitFor(description, check, deadline, initialDelay=1, maxDelay=15, sleep=time.sleep):
+    # poll check() with backoff until it returns True, raising if the deadline passes
+    started = time.time()
+    delay = initialDelay
+    while not check():
+        if time.time() - started > deadline:
+            raise Exception('gave up waiting: '+description)
+        sleep(delay)
+        delay = min(delay*2, maxDelay)
+    print(description+' after '+('%.1f' % (time.time() - started))+'s')
+
+def getVolume(ec2, volumeId):
+    try:
+        return ec2.describe_volumes(VolumeIds=[volumeId])['Volumes'][0]
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] != 'InvalidVolume.NotFound':
+            raise
+        return None
+
+def getInstanceVolumeId(ec2, instanceId, device=DATA_DEVICE):
+    instance = ec2.describe_instances(InstanceIds=[instanceId])['Reservations'][0]['Instances'][0]
+    for mapping in instance.get('BlockDeviceMappings', []):
+        if mapping['DeviceName'] == device:
+            return mapping['Ebs']['VolumeId']
+    return None
+
+def getInstanceState(ec2, instanceId):
+    try:
+        reservations = ec2.describe_instances(InstanceIds=[instanceId])['Reservations']
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] != 'InvalidInstanceID.NotFound':
+            raise
+        return 'terminated'
+    if not reservations:
+        return 'terminated'
+    return reservations[0]['Instances'][0]['State']['Name']
+
+def keepOnTermination(ec2, instanceId, device=DATA_DEVICE):
+    # keep the data volume when the instance dies so its replacement can take it over
+    ec2.modify_instance_attribute(
+        InstanceId=instanceId,
+        BlockDeviceMappings=[{'DeviceName':device, 'Ebs':{'DeleteOnTermination':False}}]
+    )
+
+def isState(ec2, volumeId, state):
+    volume = getVolume(ec2, volumeId)
+    return volume is not None and volume['State'] == state
+
+def isAttached(ec2, volumeId, instanceId):
+    volume = getVolume(ec2, volumeId)
+    return volume is not None and any(a['InstanceId'] == instanceId and a['State'] == 'attached'
+                                      for a in volume.get('Attachments', []))
+
+def releaseVolume(ec2, volume, instanceId, sleep=time.sleep):
+    # detach the volume from the old broker; force it only if that instance is already
+    # gone, otherwise a running broker could lose writes
+    for attachment in volume.get('Attachments', []):
+        if attachment['InstanceId'] == instanceId:
+            continue
+        state = getInstanceState(ec2, attachment['InstanceId'])
+        force = state not in ['pending', 'running']
+        print('detaching '+volume['VolumeId']+' from '+attachment['InstanceId']+' ('+state+')'+(' with force' if force else ''))
+        ec2.detach_volume(VolumeId=volume['VolumeId'], InstanceId=attachment['InstanceId'], Force=force)
+    waitFor(volume['VolumeId']+' is available', lambda: isState(ec2, volume['VolumeId'], 'available'), VOLUME_WAIT, sleep=sleep)
+
+def isAttaching(ec2, volumeId, instanceId):
+    volume = getVolume(ec2, volumeId)
+    return volume is not None and any(a['InstanceId'] == instanceId for a in volume.get('Attachments', []))
+
+def detachLocal(ec2, volumeId, instanceId, device, mountpoint, run, deviceExists, sleep, mounted=True, force=False):
+    # unmount and detach a volume from this instance, freeing its device name
+    if mounted:
+        run(['sudo', 'umount', mountpoint])
+    ec2.detach_volume(VolumeId=volumeId, InstanceId=instanceId, Force=force)
+    waitFor(volumeId+' is available', lambda: isState(ec2, volumeId, 'available'), VOLUME_WAIT, sleep=sleep)
+    waitFor(device+' is released', lambda: not deviceExists(device), DEVICE_WAIT, sleep=sleep)
+
+def attachLocal(ec2, volumeId, instanceId, device, mountpoint, run, deviceExists, sleep):
+    # attach a volume to this instance and mount it
+    ec2.attach_volume(VolumeId=volumeId, InstanceId=instanceId, Device=device)
+    waitFor(volumeId+' is attached', lambda: isAttached(ec2, volumeId, instanceId), VOLUME_WAIT, sleep=sleep)
+    waitFor(device+' is present', lambda: deviceExists(device), DEVICE_WAIT, sleep=sleep)
+    run(['sudo', 'mount', '-t', 'xfs', device, mountpoint])
+
+def reattach(ec2, oldVolumeId, instanceId, az, device=DATA_DEVICE, mountpoint=DATA_MOUNT,
+             run=runLocal, deviceExists=os.path.exists, sleep=time.sleep):
+    # swap the fresh data volume this instance launched with for the slot's old volume,
+    # returning the volume ID now mounted, or None if the fresh volume is kept
+    oldVolume = getVolume(ec2, oldVolumeId)
+    if oldVolume is None:
+        print('the slot\'s volume '+oldVolumeId+' no longer exists, keeping the new volume')
+        return None
+    if oldVolume['AvailabilityZone'] != az:
+        print('the slot\'s volume '+oldVolumeId+' is in '+oldVolume['AvailabilityZone']+' not '+az+', keeping the new volume')
+        return None
+
+    started = time.time()
+    try:
+        releaseVolume(ec2, oldVolume, instanceId, sleep)
+    except Exception as e:
+        # e.g. the old broker is still running and didn't let go of it in time
+        print('unable to release '+oldVolumeId+' ('+str(e)+'), keeping the new volume')
+        return None
+
+    # the old volume goes on the same device so the fstab entry and the launch mapping
+    # still match, so the fresh volume has to come off first; it is only deleted once
+    # the old volume is mounted in its place
+    freshVolumeId = getInstanceVolumeId(ec2, instanceId, device)
+    if freshVolumeId == oldVolumeId:
+        freshVolumeId = None
+    if freshVolumeId is not None:
+        detachLocal(ec2, freshVolumeId, instanceId, device, mountpoint, run, deviceExists, sleep)
+
+    try:
+        attachLocal(ec2, oldVolumeId, instanceId, device, mountpoint, run, deviceExists, sleep)
+    except Exception as e:
+        if freshVolumeId is None:
+            raise
+        print('unable to mount '+oldVolumeId+' ('+str(e)+'), going back to the new volume')
+        if isAttaching(ec2, oldVolumeId, instanceId):
+            # it never got mounted, so nothing can be lost by forcing it off
+            detachLocal(ec2, oldVolumeId, instanceId, device, mountpoint, run, deviceExists, sleep, mounted=False, force=True)
+        attachLocal(ec2, freshVolumeId, instanceId, device, mountpoint, run, deviceExists, sleep)
+        keepOnTermination(ec2, instanceId, device)
+        return None
+
+    keepOnTermination(ec2, instanceId, device)
+    if freshVolumeId is not None:
+        ec2.delete_volume(VolumeId=freshVolumeId)
+        print('deleted the unused new volume '+freshVolumeId)
+
+    print('metric volume_reattach volume='+oldVolumeId+' seconds='+('%.1f' % (time.time() - started)))
+    return oldVolumeId
@@ -0,0 +1,57 @@
+import hashlib
+import tag_lookup
+
+# Slots are named <cluster><n> for n in 1..maxinstances, e.g. kafka12. Everything here
+# works on sets of slot numbers, so any number of slots can be free or missing at once.
+
+def getNodeId(slot, prefix):
+    # the node number from the full numeric suffix of a slot name such as kafka12
+    number = tag_lookup.getSlotNumber(slot, prefix)
+    if number is None:
+        raise Exception(slot+' is not a '+prefix+' slot')
+    return number
+
+def getUnheld(held, maxinstances):
+    # the slot numbers in 1..maxinstances that are not in the set of held slots
+    return [number for number in range(1, maxinstances + 1) if number not in held]
+
+def getFreeSlots(state, cluster, maxinstances, freeIp):
+    # the slots that no node has ever claimed, or that were released
+    held = set()
+    for slot in state:
+        number = tag_lookup.getSlotNumber(slot, cluster)
+        if number is not None and state[slot].get('ip', {}).get('S', freeIp) != freeIp:
+            held.add(number)
+    return getUnheld(held, maxinstances)
+
+def getMissingSlots(slots, state, cluster, maxinstances):
+    # the slots no live ASG instance holds, from the dict of instance id -> slot number
+    # (None while the instance has no slot tag); a slot recorded against a live instance
+    # in the state is held even if that instance hasn't been tagged yet
+    held = set(number for number in slots.values() if number is not None)
+    for slot in state:
+        if state[slot].get('instance', {}).get('S') in slots:
+            number = tag_lookup.getSlotNumber(slot, cluster)
+            if number is not None:
+                held.add(number)
+    missing = getUnheld(held, maxinstances)
+    print('the missing slots are: '+str(missing))
+    return missing
+
+def getLaunching(slots):
+    # how many instances in the ASG are still waiting for a slot, this one included
+    return max(1, len([instanceId for instanceId in slots if slots[instanceId] is None]))
+
+def spreadOrder(numbers, seed, window=None):
+    # order the candidate slots from a starting point picked by hashing the seed (e.g. the
+    # instance ID), so nodes launched together try different slots first rather than all
+    # racing for the lowest one; only the first window slots are shuffled, so a cluster
+    # still fills its lowest slots, and the conditional claim settles any collision
+    numbers = sorted(numbers)
+    if window is None:
+        window = len(numbers)
+    window = min(window, len(numbers))
+    if window == 0:
+        return numbers
+    start = int(hashlib.md5(seed.encode('utf-8')).hexdigest(), 16) % window
+    return numbers[start:window] + numbers[:start] + numbers[window:]
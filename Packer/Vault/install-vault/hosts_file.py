@@ -0,0 +1,87 @@
+import json
+import os
+import subprocess
+import sys
+import atomic_file
+
+def parseLine(line):
+    # return (address, [names]) for a hosts entry, or None for comments and blanks
+    content = line.split('#', 1)[0].split()
+    if len(content) < 2:
+        return None
+    return (content[0], content[1:])
+
+def applyMapping(lines, mapping):
+    # compute the new hosts file lines for a dict of name -> IP in a single pass,
+    # returning the new lines and the sorted list of names whose entry changed
+    newLines = []
+    seen = set()
+    changed = set()
+    for line in lines:
+        entry = parseLine(line)
+        # only single-name entries are managed, e.g. "10.0.0.1 kafka1"
+        if entry is None or len(entry[1]) != 1 or entry[1][0] not in mapping:
+            newLines.append(line)
+            continue
+
+        name = entry[1][0]
+        if name in seen:
+            # drop duplicate entries for a managed name
+            changed.add(name)
+            continue
+        seen.add(name)
+
+        if entry[0] == mapping[name]:
+            newLines.append(line)
+        else:
+            newLines.append(mapping[name]+' '+name+'\n')
+            changed.add(name)
+
+    # make sure the last line is terminated before appending new entries
+    if newLines and not newLines[-1].endswith('\n'):
+        newLines[-1] = newLines[-1]+'\n'
+    for name in sorted(mapping):
+        if name not in seen:
+            newLines.append(mapping[name]+' '+name+'\n')
+            changed.add(name)
+
+    return [newLines, sorted(changed)]
+
+def updateHostsFile(path, mapping):
+    # bring the hosts file in line with the mapping, writing only if something changed
+    with open(path, 'r') as f:
+        lines = f.readlines()
+
+    retvals = applyMapping(lines, mapping)
+    newLines = retvals[0]
+    changed = retvals[1]
+    if changed:
+        print('updating '+path+' entries: '+' '.join(changed))
+        atomic_file.writeAtomically(path, newLines, relabel=True)
+    else:
+        print(path+' is already up to date')
+    return changed
+
+def sudoUpdateHostsFile(mapping, path='/etc/hosts'):
+    # run this script once under sudo to apply the whole mapping, returning the changed names
+    args = ['sudo', sys.executable, os.path.abspath(__file__), path]
+    for name in sorted(mapping):
+        args.append(name+'='+mapping[name])
+    output = subprocess.check_output(args).decode('utf-8')
+    print(output)
+    return json.loads(output.strip().splitlines()[-1])['changed']
+
+if __name__ == "__main__":
+    # hosts_file.py <hosts file> name=ip [name=ip ...]
+    if len(sys.argv) < 2:
+        print("Usage: "+sys.argv[0]+" <hosts file> name=ip [name=ip ...]")
+        sys.exit(1)
+
+    mapping = {}
+    for arg in sys.argv[2:]:
+        name, ip = arg.split('=', 1)
+        mapping[name] = ip
+
+    changed = updateHostsFile(sys.argv[1], mapping)
+    # the last line of output is machine readable for the calling script
+    print(json.dumps({'changed':changed}))
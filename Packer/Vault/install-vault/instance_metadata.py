@@ -0,0 +1,74 @@
+import json
+import os
+from six.moves import http_client
+
+# the metadata service can be pointed elsewhere (e.g. a local fake server)
+METADATA_HOST = os.environ.get('METADATA_HOST', '169.254.169.254')
+METADATA_PORT = int(os.environ.get('METADATA_PORT', '80'))
+TOKEN_TTL = '21600'
+TIMEOUT = 2
+
+# the identity document is cached for the lifetime of the boot
+CACHE_FILE = os.environ.get('METADATA_CACHE', '/tmp/instance-identity.json')
+BOOT_ID_FILE = '/proc/sys/kernel/random/boot_id'
+
+def getBootId():
+    try:
+        with open(BOOT_ID_FILE, 'r') as f:
+            return f.read().strip()
+    except IOError:
+        return ''
+
+def readCache(bootId):
+    try:
+        with open(CACHE_FILE, 'r') as f:
+            cached = json.load(f)
+    except (IOError, ValueError):
+        return None
+
+    # a cache written before the last reboot may describe another instance
+    if cached.get('bootId') != bootId:
+        return None
+    return cached.get('identity')
+
+def writeCache(bootId, identity):
+    tmpFile = CACHE_FILE+'.'+str(os.getpid())
+    try:
+        with open(tmpFile, 'w') as f:
+            json.dump({'bootId':bootId, 'identity':identity}, f)
+        os.rename(tmpFile, CACHE_FILE)
+    except (IOError, OSError) as e:
+        print('unable to cache the identity document: '+str(e))
+
+def fetchIdentity():
+    # one IMDSv2 token request and one identity document request,
+    # both over the same HTTP connection
+    conn = http_client.HTTPConnection(METADATA_HOST, METADATA_PORT, timeout=TIMEOUT)
+    try:
+        conn.request('PUT', '/latest/api/token', headers={'X-aws-ec2-metadata-token-ttl-seconds':TOKEN_TTL})
+        response = conn.getresponse()
+        token = response.read().decode('utf-8').strip()
+        if response.status != 200:
+            raise Exception('metadata token request failed with status: '+str(response.status))
+
+        conn.request('GET', '/latest/dynamic/instance-identity/document', headers={'X-aws-ec2-metadata-token':token})
+        response = conn.getresponse()
+        document = response.read().decode('utf-8')
+        if response.status != 200:
+            raise Exception('identity document request failed with status: '+str(response.status))
+    finally:
+        conn.close()
+
+    return json.loads(document)
+
+def getIdentity():
+    # return the parsed instance identity document (privateIp, instanceId,
+    # region, availabilityZone, instanceType, ...)
+    bootId = getBootId()
+    identity = readCache(bootId)
+    if identity is None:
+        identity = fetchIdentity()
+        writeCache(bootId, identity)
+
+    print('the instance identity is: '+str(identity))
+    return identity
@@ -1,40 +1,34 @@
 import json
 import boto3
+import state_table
+import hosts_file
+import instance_metadata
 import botocore
 import subprocess
 import sys
 
 def updateHosts(vkmaxInstances):
 
-    session = boto3.Session(profile_name='terraform')
-    dynamodb = session.resource('dynamodb')
-    table = dynamodb.Table('vault-state')
-
-    try:
-        response = table.get_item(
-            Key={
-                'state_name': 'vault'
-            }
-        )
-        print('the dynamodb response is: '+str(response))
-        vdata = response['Item']
-        print('the state stored in the dynamodb table is: '+str(vdata))
-    except Exception as e:
-        print('the exception is: '+str(e))
-        if str(e) == '\'Item\'':
-            print('there is no item the first time the table is read, ignore')
-        else:
-            raise e
+    # reuse the cached identity document rather than querying the metadata service again
+    region = instance_metadata.getIdentity()['region']
+    session = boto3.Session(profile_name='terraform', region_name=region)
+    client = session.client('dynamodb')
+
+    vdata = state_table.getIps(client, 'vault-state', 'vault')
 
     print (vdata)
 
+    # build the full set of entries so /etc/hosts is rewritten at most once
+    hosts = {}
+
     #update the vault IP's
     index = 0
     print('the max vault instances is: '+str(vkmaxInstances))
     while index < int(vkmaxInstances):
         index += 1
-        print(index, vdata['vault'+str(index)])
-        subprocess.check_output("sudo python /tmp/install-vault/replaceAll.py /etc/hosts \"0.0.0.0 vault"+str(index)+"\" \""+vdata['vault'+str(index)]+" vault"+str(index)+"\"", shell=True, executable='/bin/bash')
+        hosts['vault'+str(index)] = vdata.get('vault'+str(index), '0.0.0.0')
+
+    hosts_file.sudoUpdateHostsFile(hosts)
 
 
 if __name__ == "__main__":
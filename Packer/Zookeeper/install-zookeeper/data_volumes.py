@@ -0,0 +1,191 @@
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+
+FSTAB = '/etc/fstab'
+MOUNT_OPTIONS = 'defaults,noatime,nofail'
+
+# size of the sequential direct write used to measure each volume
+BENCHMARK_MB = 256
+# number of small synchronous writes used to measure fsync latency
+FSYNC_SAMPLES = 500
+FSYNC_WRITE_BYTES = 4096
+
+def listBlockDevices():
+    # every block device as a dict of the lsblk columns, e.g. {'NAME':'xvdf', 'TYPE':'disk', ...}
+    output = subprocess.check_output(['lsblk', '-P', '-b', '-o', 'NAME,TYPE,MOUNTPOINT,SIZE,FSTYPE,PKNAME']).decode('utf-8')
+    devices = []
+    for line in output.splitlines():
+        device = {}
+        for field in shlex.split(line):
+            key, value = field.split('=', 1)
+            device[key] = value
+        devices.append(device)
+    return devices
+
+def getDataDisks(devices, mountPrefix):
+    # the whole disks that can hold data: either already mounted under the prefix, or
+    # unpartitioned and unmounted (new EBS volumes and NVMe instance stores); the root
+    # disk and anything else in use is left alone
+    parents = set(d.get('PKNAME', '') for d in devices if d.get('PKNAME', '') != '')
+    disks = []
+    for device in devices:
+        if device['TYPE'] != 'disk' or device['NAME'] in parents:
+            continue
+        mountpoint = device.get('MOUNTPOINT', '')
+        if mountpoint != '' and not mountpoint.startswith(mountPrefix):
+            continue
+        if device.get('FSTYPE', '') == 'swap' or device.get('SIZE', '0') == '0':
+            continue
+        # compressed memory and loop devices are reported as disks too
+        if device['NAME'].startswith(('zram', 'ram', 'loop')):
+            continue
+        disks.append(device)
+    return sorted(disks, key=lambda d: d['NAME'])
+
+def getUuid(path):
+    return subprocess.check_output(['blkid', '-s', 'UUID', '-o', 'value', path]).decode('utf-8').strip()
+
+def nextMountpoint(mountPrefix, used):
+    index = 1
+    while mountPrefix+'-'+str(index) in used or os.path.ismount(mountPrefix+'-'+str(index)):
+        index += 1
+    return mountPrefix+'-'+str(index)
+
+def addFstabEntry(uuid, mountpoint, fstype):
+    # mount by UUID since device names can change between boots, and don't block
+    # the boot if the volume is missing
+    with open(FSTAB, 'r') as f:
+        lines = f.readlines()
+    for line in lines:
+        fields = line.split()
+        if len(fields) > 1 and not line.startswith('#') and (fields[0] == 'UUID='+uuid or fields[1] == mountpoint):
+            return
+    with open(FSTAB, 'a') as f:
+        if lines and not lines[-1].endswith('\n'):
+            f.write('\n')
+        f.write('UUID='+uuid+' '+mountpoint+' '+fstype+' '+MOUNT_OPTIONS+' 0 2\n')
+
+def prepareDisk(device, mountPrefix, used, owner):
+    # format (only if blank) and mount one disk, returning its mountpoint (or None if
+    # it can't be used) and whether the filesystem was just created
+    path = '/dev/'+device['NAME']
+    mountpoint = device.get('MOUNTPOINT', '')
+    if mountpoint != '':
+        return [mountpoint, False]
+
+    fstype = device.get('FSTYPE', '')
+    formatted = fstype == ''
+    if formatted:
+        # Kafka recommends XFS: https://kafka.apache.org/documentation/#filesystems
+        print('formatting '+path+' as xfs')
+        subprocess.check_call(['mkfs.xfs', '-f', path])
+        fstype = 'xfs'
+    elif fstype not in ['xfs', 'ext4']:
+        print('leaving '+path+' alone, it has a '+fstype+' filesystem')
+        return [None, False]
+
+    mountpoint = nextMountpoint(mountPrefix, used)
+    print('mounting '+path+' at '+mountpoint)
+    if not os.path.isdir(mountpoint):
+        os.makedirs(mountpoint)
+    subprocess.check_call(['mount', '-t', fstype, '-o', MOUNT_OPTIONS, path, mountpoint])
+    addFstabEntry(getUuid(path), mountpoint, fstype)
+    subprocess.check_call(['chown', owner+':'+owner, mountpoint])
+    return [mountpoint, formatted]
+
+def benchmark(mountpoint, megabytes=BENCHMARK_MB):
+    # sequential direct write throughput of the volume in MB/s, or None if the write
+    # failed (e.g. the disk is full), which isn't worth failing the boot over
+    testFile = os.path.join(mountpoint, '.benchmark')
+    started = time.time()
+    try:
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(['dd', 'if=/dev/zero', 'of='+testFile, 'bs=1M', 'count='+str(megabytes),
+                                   'oflag=direct', 'conv=fsync'], stdout=devnull, stderr=devnull)
+        seconds = time.time() - started
+    except (subprocess.CalledProcessError, OSError) as e:
+        print('metric disk_write_mbps mountpoint='+mountpoint+' outcome=failed error='+str(e).replace(' ', '_'))
+        return None
+    finally:
+        if os.path.exists(testFile):
+            os.unlink(testFile)
+    mbps = megabytes / seconds
+    print('metric disk_write_mbps mountpoint='+mountpoint+' mbps='+('%.1f' % mbps))
+    return mbps
+
+def fsyncLatency(directory, samples=FSYNC_SAMPLES):
+    # the p50 and p99 latency in ms of a small write followed by an fsync, the pattern
+    # of a transaction log append
+    testFile = os.path.join(directory, '.fsync-benchmark')
+    data = b'x'*FSYNC_WRITE_BYTES
+    latencies = []
+    fd = os.open(testFile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        for i in range(samples):
+            started = time.time()
+            os.write(fd, data)
+            os.fsync(fd)
+            latencies.append((time.time() - started)*1000)
+    finally:
+        os.close(fd)
+        os.unlink(testFile)
+
+    latencies.sort()
+    result = {
+        'p50': round(latencies[len(latencies)//2], 2),
+        'p99': round(latencies[min(len(latencies) - 1, int(len(latencies)*0.99))], 2)
+    }
+    print('metric fsync_latency_ms directory='+directory+' p50='+str(result['p50'])+' p99='+str(result['p99']))
+    return result
+
+def prepareVolumes(mountPrefix, owner='ec2-user', runBenchmark=True):
+    # format and mount every data disk, returning a dict of mountpoint -> {device, mbps},
+    # where mbps is only measured on newly formatted disks
+    volumes = {}
+    used = set()
+    for device in getDataDisks(listBlockDevices(), mountPrefix):
+        mountpoint, formatted = prepareDisk(device, mountPrefix, used, owner)
+        if mountpoint is None:
+            continue
+        used.add(mountpoint)
+        volumes[mountpoint] = {'device':'/dev/'+device['NAME']}
+        # only measure an empty volume, a volume with data on it may be serving a broker
+        # or have been reattached from one
+        if runBenchmark and formatted:
+            mbps = benchmark(mountpoint)
+            if mbps is not None:
+                volumes[mountpoint]['mbps'] = round(mbps, 1)
+    print('data volumes: '+str(volumes))
+    return volumes
+
+def sudoPrepareVolumes(mountPrefix, runBenchmark=True):
+    # run this script under sudo to prepare the volumes, returning the result
+    args = ['sudo', sys.executable, os.path.abspath(__file__), mountPrefix]
+    if not runBenchmark:
+        args.append('nobenchmark')
+    output = subprocess.check_output(args).decode('utf-8')
+    print(output)
+    return json.loads(output.strip().splitlines()[-1])
+
+def toStateAttributes(volumes):
+    # the volumes as a DynamoDB map attribute for the node's slot item
+    item = {}
+    for mountpoint in volumes:
+        entry = {'device': {'S':volumes[mountpoint]['device']}}
+        if 'mbps' in volumes[mountpoint]:
+            entry['mbps'] = {'N':str(volumes[mountpoint]['mbps'])}
+        item[mountpoint] = {'M':entry}
+    return {'volumes': {'M':item}}
+
+if __name__ == "__main__":
+    # data_volumes.py <mount prefix, e.g. /data/kafka> [nobenchmark]
+    if len(sys.argv) < 2:
+        print("Usage: "+sys.argv[0]+" <mount prefix> [nobenchmark]")
+        sys.exit(1)
+    volumes = prepareVolumes(sys.argv[1], runBenchmark='nobenchmark' not in sys.argv[2:])
+    # the last line of output is machine readable for the calling script
+    print(json.dumps(volumes))
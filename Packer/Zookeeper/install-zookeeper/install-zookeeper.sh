@@ -34,7 +34,24 @@ tar -xvzf kafka_2.12-0.11.0.2.tgz
 rm kafka_2.12-0.11.0.2.tgz
 sudo mkdir -p /opt/zookeeper
 sudo mv kafka_2.12-0.11.0.2 /opt/zookeeper/kafka
+
+# swap the ZooKeeper 3.4 server bundled with Kafka for 3.5, which supports dynamic
+# reconfiguration of the ensemble
+wget https://archive.apache.org/dist/zookeeper/zookeeper-3.5.9/apache-zookeeper-3.5.9-bin.tar.gz
+tar -xvzf apache-zookeeper-3.5.9-bin.tar.gz
+rm apache-zookeeper-3.5.9-bin.tar.gz
+sudo rm /opt/zookeeper/kafka/libs/zookeeper-3.4.10.jar
+sudo cp apache-zookeeper-3.5.9-bin/lib/zookeeper-3.5.9.jar \
+        apache-zookeeper-3.5.9-bin/lib/zookeeper-jute-3.5.9.jar \
+        apache-zookeeper-3.5.9-bin/lib/audience-annotations-*.jar \
+        apache-zookeeper-3.5.9-bin/lib/commons-cli-*.jar /opt/zookeeper/kafka/libs/
+rm -rf apache-zookeeper-3.5.9-bin
+
 sudo mv /tmp/install-zookeeper/zookeeper.properties /opt/zookeeper/kafka/config/zookeeper.properties
+sudo mv /tmp/install-zookeeper/zookeeper.properties.dynamic /opt/zookeeper/kafka/config/zookeeper.properties.dynamic
+# the super user allowed to reconfigure the ensemble, shared by every server built from this AMI
+sudo python /tmp/install-zookeeper/zk_reconfig.py superuser
+sudo chown ec2-user:ec2-user /opt/zookeeper/kafka/config/zookeeper-super.password
 #cd /opt/zookeeper/kafka
 # Zookeeper quickstart
 #cat config/zookeeper.properties
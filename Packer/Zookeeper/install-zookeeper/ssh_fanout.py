@@ -0,0 +1,82 @@
+import threading
+import time
+import paramiko
+from six.moves import queue
+
+# bound the number of concurrent SSH sessions and how long each may take
+MAX_WORKERS = 8
+CONNECT_TIMEOUT = 10
+COMMAND_TIMEOUT = 300
+
+def runOnHost(name, address, command, privateKey, username, connectTimeout, commandTimeout):
+    # run the command on one host and wait for its exit status
+    result = {'host':name, 'address':address, 'status':None, 'output':'', 'error':None}
+    started = time.time()
+    client = paramiko.client.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    try:
+        client.connect(address, port=22, username=username, pkey=privateKey,
+                       timeout=connectTimeout, banner_timeout=connectTimeout, auth_timeout=connectTimeout,
+                       look_for_keys=False, allow_agent=False)
+        stdin, stdout, stderr = client.exec_command(command, timeout=commandTimeout)
+        # read to EOF (bounded by the command timeout) before asking for the exit status
+        result['output'] = stdout.read().decode('utf-8', 'replace')
+        result['status'] = stdout.channel.recv_exit_status()
+        if result['status'] != 0:
+            result['error'] = stderr.read().decode('utf-8', 'replace').strip()
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        client.close()
+    result['seconds'] = time.time() - started
+    return result
+
+def runOnHosts(hosts, command, keyFile, username='ec2-user', maxWorkers=MAX_WORKERS,
+               connectTimeout=CONNECT_TIMEOUT, commandTimeout=COMMAND_TIMEOUT):
+    # run the command on every host (a dict of name -> address) concurrently,
+    # returning a dict of name -> result with the exit status, output and latency
+    results = {}
+    if not hosts:
+        return results
+
+    # load the key once for every connection
+    privateKey = paramiko.RSAKey.from_private_key_file(keyFile)
+
+    work = queue.Queue()
+    for name in sorted(hosts):
+        work.put(name)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            try:
+                name = work.get_nowait()
+            except queue.Empty:
+                return
+            print('running on '+name+': '+command)
+            result = runOnHost(name, hosts[name], command, privateKey, username, connectTimeout, commandTimeout)
+            with lock:
+                results[name] = result
+
+    threads = []
+    for i in range(min(maxWorkers, len(hosts))):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+    report(results)
+    return results
+
+def report(results):
+    for name in sorted(results):
+        result = results[name]
+        if result['error'] is None:
+            print(name+' ('+result['address']+') succeeded in '+('%.2f' % result['seconds'])+'s')
+        else:
+            print(name+' ('+result['address']+') failed in '+('%.2f' % result['seconds'])+'s with status '+str(result['status'])+': '+result['error'])
+
+def getFailures(results):
+    return [name for name in sorted(results) if results[name]['error'] is not None]
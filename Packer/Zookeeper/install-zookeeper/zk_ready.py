@@ -0,0 +1,135 @@
+import socket
+import sys
+import threading
+import time
+
+SERVER_PROPERTIES = '/opt/kafka/config/server.properties'
+
+# poll quickly at first and back off, giving up after the deadline
+READY_DEADLINE = 600
+INITIAL_DELAY = 0.2
+MAX_DELAY = 5
+COMMAND_TIMEOUT = 2
+
+def fourLetterWord(host, port, command, timeout=COMMAND_TIMEOUT):
+    # send a ZooKeeper four letter command and return the whole reply
+    sock = socket.create_connection((host, port), timeout)
+    try:
+        sock.sendall(command.encode('ascii'))
+        reply = b''
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                break
+            reply += data
+    finally:
+        sock.close()
+    return reply.decode('utf-8', 'replace')
+
+def parseStats(reply):
+    # parse "key<tab>value" (mntr) or "key: value" (srvr) lines into a dict
+    stats = {}
+    for line in reply.splitlines():
+        if '\t' in line:
+            key, value = line.split('\t', 1)
+        elif ': ' in line:
+            key, value = line.split(': ', 1)
+        else:
+            continue
+        stats[key.strip()] = value.strip()
+    return stats
+
+def checkMember(member):
+    # check one ensemble member is healthy and find its role
+    host, port = member.rsplit(':', 1)
+    result = {'member':member, 'ok':False, 'mode':None, 'synced_followers':None}
+    try:
+        if fourLetterWord(host, int(port), 'ruok') != 'imok':
+            return result
+        result['ok'] = True
+        result['mode'] = parseStats(fourLetterWord(host, int(port), 'srvr')).get('Mode')
+        if result['mode'] == 'leader':
+            synced = parseStats(fourLetterWord(host, int(port), 'mntr')).get('zk_synced_followers')
+            if synced is not None:
+                result['synced_followers'] = int(synced)
+    except (socket.error, ValueError) as e:
+        result['error'] = str(e)
+    return result
+
+def checkEnsemble(members):
+    # check every member in parallel, returning a dict of member -> result
+    results = {}
+    lock = threading.Lock()
+
+    def check(member):
+        result = checkMember(member)
+        with lock:
+            results[member] = result
+
+    threads = [threading.Thread(target=check, args=(member,)) for member in members]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    deadline = time.time() + COMMAND_TIMEOUT*4
+    for thread in threads:
+        thread.join(max(0, deadline - time.time()))
+
+    # take a copy under the lock since a slow probe may still be running, and count
+    # any member that hasn't answered yet as not ready
+    with lock:
+        answered = dict(results)
+    for member in members:
+        if member not in answered:
+            answered[member] = {'member':member, 'ok':False, 'mode':None, 'synced_followers':None, 'error':'timed out'}
+    return answered
+
+def hasQuorum(members, results):
+    # ready once there is exactly one leader and a majority of the ensemble serving
+    majority = len(members) // 2 + 1
+    modes = [results[m]['mode'] for m in results if results[m]['ok']]
+    if len(members) == 1:
+        return modes == ['standalone'] or modes == ['leader']
+
+    leaders = [results[m] for m in results if results[m]['mode'] == 'leader']
+    if len(leaders) != 1:
+        return False
+    serving = modes.count('leader') + modes.count('follower')
+    synced = leaders[0]['synced_followers']
+    if synced is not None:
+        serving = max(serving, synced + 1)
+    return serving >= majority
+
+def waitForQuorum(members, deadline=READY_DEADLINE):
+    # poll the ensemble until it has a quorum and a leader, returning True as soon as it does
+    started = time.time()
+    delay = INITIAL_DELAY
+    while True:
+        results = checkEnsemble(members)
+        if hasQuorum(members, results):
+            leader = [m for m in results if results[m]['mode'] == 'leader']
+            print('zookeeper has quorum (leader '+str(leader)+') after '+('%.1f' % (time.time() - started))+'s')
+            return True
+        print('waiting for zookeeper quorum: '+str(dict((m, results[m]['mode']) for m in results)))
+        if time.time() - started > deadline:
+            print('gave up waiting for zookeeper quorum')
+            return False
+        time.sleep(delay)
+        delay = min(delay*2, MAX_DELAY)
+
+def getEnsemble(path=SERVER_PROPERTIES):
+    # the ensemble from zookeeper.connect, dropping any chroot
+    with open(path, 'r') as f:
+        for line in f:
+            if line.startswith('zookeeper.connect='):
+                connect = line.split('=', 1)[1].strip().split('/', 1)[0]
+                return connect.split(',')
+    raise Exception('zookeeper.connect is not set in '+path)
+
+if __name__ == "__main__":
+    # zk_ready.py [host:port,host:port,...] - defaults to zookeeper.connect in server.properties
+    if len(sys.argv) > 1:
+        members = sys.argv[1].split(',')
+    else:
+        members = getEnsemble()
+    if not waitForQuorum(members):
+        sys.exit(1)
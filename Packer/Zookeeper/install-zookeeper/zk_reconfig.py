@@ -0,0 +1,165 @@
+import base64
+import binascii
+import hashlib
+import json
+import os
+import sys
+import time
+from kazoo.client import KazooClient
+from kazoo.exceptions import KazooException
+from kazoo.handlers.threading import KazooTimeoutError
+import atomic_file
+import zk_ready
+import properties_file
+
+CONFIG_PATH = '/opt/zookeeper/kafka/config'
+STATIC_CONFIG = CONFIG_PATH+'/zookeeper.properties'
+DYNAMIC_CONFIG = CONFIG_PATH+'/zookeeper.properties.dynamic'
+# reconfig is restricted to the super user, whose password is generated when the AMI is
+# built so every server in the ensemble shares it; zookeeper.sh passes the digest to the JVM
+SUPER_PASSWORD = CONFIG_PATH+'/zookeeper-super.password'
+SUPER_DIGEST = CONFIG_PATH+'/zookeeper-super.digest'
+CLIENT_PORT = 2181
+QUORUM_PORT = 2888
+ELECTION_PORT = 3888
+
+CONNECT_TIMEOUT = 15
+# how long the new server has to sync with the leader before it is added
+SYNC_DEADLINE = 300
+
+def getSuperDigest(password):
+    # the super user's entry in the form DigestAuthenticationProvider.superDigest takes
+    digest = hashlib.sha1(('super:'+password).encode('utf-8')).digest()
+    return 'super:'+base64.b64encode(digest).decode('utf-8')
+
+def generateSuperUser(passwordPath=SUPER_PASSWORD, digestPath=SUPER_DIGEST):
+    # only the reconfig client can read the password, the server only needs the digest
+    password = binascii.hexlify(os.urandom(24)).decode('utf-8')
+    atomic_file.writeAtomically(passwordPath, [password+'\n'], mode=0o600)
+    atomic_file.writeAtomically(digestPath, [getSuperDigest(password)+'\n'])
+    print('generated the zookeeper super user digest in '+digestPath)
+
+def getAuthData(passwordPath=SUPER_PASSWORD):
+    with open(passwordPath, 'r') as f:
+        return [('digest', 'super:'+f.read().strip())]
+
+def getServerSpec(myid, address=None):
+    # the dynamic config line for a server; a new ensemble is bootstrapped by host name
+    # since the other nodes' IPs aren't known yet, a joining server is added by IP so
+    # the reconfig itself moves the server without relying on /etc/hosts
+    if address is None:
+        address = 'zookeeper'+str(myid)
+    return ('server.'+str(myid)+'='+address+':'+str(QUORUM_PORT)+':'+str(ELECTION_PORT)+
+            ':participant;'+str(CLIENT_PORT))
+
+def parseConfig(config):
+    # the server lines of a dynamic config as a dict of id -> line
+    servers = {}
+    for line in config.splitlines():
+        line = line.strip()
+        if line.startswith('server.'):
+            servers[int(line.split('=', 1)[0].split('.', 1)[1])] = line
+    return servers
+
+def getCurrentConfig(peers):
+    # the ensemble's current config from /zookeeper/config, or None if there is no quorum to ask
+    if not peers:
+        return None
+    client = KazooClient(hosts=','.join(peer+':'+str(CLIENT_PORT) for peer in peers), timeout=CONNECT_TIMEOUT)
+    try:
+        client.start(timeout=CONNECT_TIMEOUT)
+    except KazooTimeoutError:
+        print('no zookeeper quorum among '+str(peers))
+        return None
+    try:
+        client.sync('/zookeeper/config')
+        return client.get('/zookeeper/config')[0].decode('utf-8')
+    finally:
+        client.stop()
+        client.close()
+
+def writeDynamicConfig(servers, path=DYNAMIC_CONFIG):
+    lines = [servers[myid]+'\n' for myid in sorted(servers)]
+    atomic_file.writeAtomically(path, lines)
+    print('wrote '+path+':\n'+''.join(lines))
+
+def prepare(myid, ip, maxinstances, peers):
+    # write the config this server starts with, returning the mode:
+    # - join: a quorum is already running, so start with its current membership plus this
+    #   server and add it with a reconfig once it has synced, leaving the others running
+    # - bootstrap: there is no ensemble yet, so start with every slot as a participant
+    config = getCurrentConfig(peers)
+    if config is not None:
+        servers = parseConfig(config)
+        print('the current ensemble is: '+str(servers))
+        servers[myid] = getServerSpec(myid, ip)
+        mode = 'join'
+    else:
+        servers = {}
+        for index in range(1, maxinstances+1):
+            servers[index] = getServerSpec(index)
+        mode = 'bootstrap'
+    writeDynamicConfig(servers)
+    # zookeeper points the static config at a new versioned file after each reconfig
+    properties_file.updateProperties(STATIC_CONFIG, {'dynamicConfigFile':DYNAMIC_CONFIG})
+    return mode
+
+def waitForSync(deadline=SYNC_DEADLINE):
+    # wait for the local server to sync with the leader, at first as a non-voting follower
+    started = time.time()
+    delay = zk_ready.INITIAL_DELAY
+    while True:
+        mode = zk_ready.checkMember('127.0.0.1:'+str(CLIENT_PORT))['mode']
+        if mode in ['leader', 'follower', 'observer']:
+            print('synced with the ensemble as a '+mode+' after '+('%.1f' % (time.time() - started))+'s')
+            return True
+        if time.time() - started > deadline:
+            return False
+        time.sleep(delay)
+        delay = min(delay*2, zk_ready.MAX_DELAY)
+
+def join(myid, ip, peers):
+    # once this server has synced with the leader, add (or re-add) it to the ensemble
+    if not waitForSync():
+        raise Exception('zookeeper'+str(myid)+' did not sync with the ensemble')
+
+    spec = getServerSpec(myid, ip)
+    current = parseConfig(getCurrentConfig(peers) or '')
+    if current.get(myid) == spec:
+        print(spec+' is already a member of the ensemble')
+        return
+
+    client = KazooClient(hosts=','.join(peer+':'+str(CLIENT_PORT) for peer in peers), timeout=CONNECT_TIMEOUT,
+                         auth_data=getAuthData())
+    client.start(timeout=CONNECT_TIMEOUT)
+    try:
+        started = time.time()
+        # an existing server with the same id (the node being replaced) is updated in place
+        config = client.reconfig(joining=spec, leaving=None, new_members=None)[0].decode('utf-8')
+        print('reconfig added '+spec+' in '+('%.1f' % (time.time() - started))+'s')
+        print('the ensemble is now: '+config)
+    except KazooException as e:
+        print('reconfig of '+spec+' failed: '+str(e))
+        raise
+    finally:
+        client.stop()
+        client.close()
+
+if __name__ == "__main__":
+    # zk_reconfig.py prepare <myid> <ip> <max instances> [peer ...]
+    # zk_reconfig.py join <myid> <ip> [peer ...]
+    # zk_reconfig.py superuser
+    if len(sys.argv) == 2 and sys.argv[1] == 'superuser':
+        generateSuperUser()
+        sys.exit(0)
+    if len(sys.argv) < 4 or sys.argv[1] not in ['prepare', 'join']:
+        print("Usage: "+sys.argv[0]+" prepare <myid> <ip> <max instances> [peer ...] | join <myid> <ip> [peer ...] | superuser")
+        sys.exit(1)
+
+    myid = int(sys.argv[2])
+    if sys.argv[1] == 'prepare':
+        mode = prepare(myid, sys.argv[3], int(sys.argv[4]), sys.argv[5:])
+        # the last line of output is machine readable for the calling script
+        print(json.dumps({'mode':mode}))
+    else:
+        join(myid, sys.argv[3], sys.argv[4:])
@@ -23,6 +23,16 @@ DAEMON_NAME=zookeeper
 
 PATH=$PATH:$DAEMON_PATH
 
+# JVM settings generated for this instance by jvm_profile.py
+if [ -f /opt/zookeeper/kafka/config/zookeeper-env.sh ]; then
+  . /opt/zookeeper/kafka/config/zookeeper-env.sh
+fi
+
+# the super user that zk_reconfig.py authenticates as to reconfigure the ensemble
+if [ -f /opt/zookeeper/kafka/config/zookeeper-super.digest ]; then
+  export KAFKA_OPTS="$KAFKA_OPTS -Dzookeeper.DigestAuthenticationProvider.superDigest=`cat /opt/zookeeper/kafka/config/zookeeper-super.digest`"
+fi
+
 # See how we were called.
 case "$1" in
   start)
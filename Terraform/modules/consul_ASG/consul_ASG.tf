@@ -2,10 +2,16 @@ resource "aws_dynamodb_table" "consul-state-table" {
   name           = "consul-state"
   read_capacity  = 20
   write_capacity = 20
-  hash_key       = "state_name"
+  hash_key       = "cluster"
+  range_key      = "slot"
 
   attribute {
-    name = "state_name"
+    name = "cluster"
+    type = "S"
+  }
+
+  attribute {
+    name = "slot"
     type = "S"
   }
 
@@ -2,18 +2,20 @@
 exec > >(tee /var/log/user-data.log|logger -t user-data -s 2>/dev/console) 2>&1
 echo BEGIN
 su ec2-user -c 'source ~/.bash_profile; python /tmp/install-kafka/conf_kafka.py'
-# wait for the zookeeper cluster to complete setup
-max=10
-for (( i=0; i <= $max; ++i ))
-do
-echo "waiting for Zookeeper - $i"
-if ! su ec2-user -c 'source ~/.bash_profile; nc --send-only </dev/null zookeeper1 2181'; then
+# wait for the zookeeper ensemble to have a quorum and a leader
+if ! su ec2-user -c 'source ~/.bash_profile; python /tmp/install-kafka/zk_ready.py'; then
   echo "Zookeeper not ready"
-  sleep 30
+# check the data volume belongs to this slot's broker.id and cluster before starting
+elif ! su ec2-user -c 'source ~/.bash_profile; python /tmp/install-kafka/broker_identity.py verify'; then
+  echo "Broker identity does not match the data volume"
 else
   # start kafka
   su ec2-user -c 'sudo service kafka start\'
-  break
+  # wait for the broker to write meta.properties and record its cluster.id against its slot
+  su ec2-user -c 'source ~/.bash_profile; python /tmp/install-kafka/broker_identity.py record'
+  # check the broker picked up the heap and GC settings
+  su ec2-user -c 'sudo python /tmp/install-kafka/jvm_profile.py kafka verify' || true
+  # now this broker is serving its replicas, restart the peers whose hosts entries changed
+  su ec2-user -c 'source ~/.bash_profile; python /tmp/install-kafka/rolling_restart.py pending'
 fi
-done
 echo END
\ No newline at end of file
@@ -12,22 +12,17 @@ if ! su ec2-user -c 'source ~/.bash_profile; nc --send-only </dev/null zookeeper
   sleep 30
 else
   su ec2-user -c 'source ~/.bash_profile; sudo service kafkaconnect stop'
+  # the internal topics are created by the worker from worker.properties
   result=$(su ec2-user -c 'source ~/.bash_profile; /opt/kafka/bin/kafka-topics.sh --list --zookeeper zookeeper1:2181,zookeeper2:2181,zookeeper3:2181/kafka')
-  if [[ $result == *"connect-offsets"* ]] || [[ $result == *"connect-config"* ]] || [[ $result == *"connect-status"* ]] || [[ $result == *"connect-data"* ]]; then
-    echo "kafka connect topics already created"
-    # run kafka connect
-    su ec2-user -c 'source ~/.bash_profile; sudo service kafkaconnect start'
-    break
-  else
-    # set up kafka connect topics in existing kafka cluster
-    su ec2-user -c 'source ~/.bash_profile; /opt/kafka/bin/kafka-topics.sh --create --zookeeper zookeeper1:2181,zookeeper2:2181,zookeeper3:2181/kafka --replication-factor 2 --partitions 3 --topic connect-offsets'
-    su ec2-user -c 'source ~/.bash_profile; /opt/kafka/bin/kafka-topics.sh --create --zookeeper zookeeper1:2181,zookeeper2:2181,zookeeper3:2181/kafka --replication-factor 2 --partitions 3 --topic connect-config'
-    su ec2-user -c 'source ~/.bash_profile; /opt/kafka/bin/kafka-topics.sh --create --zookeeper zookeeper1:2181,zookeeper2:2181,zookeeper3:2181/kafka --replication-factor 2 --partitions 3 --topic connect-status'
+  if [[ $result != *"connect-data"* ]]; then
     su ec2-user -c 'source ~/.bash_profile; /opt/kafka/bin/kafka-topics.sh --create --zookeeper zookeeper1:2181,zookeeper2:2181,zookeeper3:2181/kafka --replication-factor 2 --partitions 3 --topic connect-data'
-    # run kafka connect
-    su ec2-user -c 'source ~/.bash_profile; sudo service kafkaconnect start'
-    break
   fi
+  # run kafka connect
+  su ec2-user -c 'source ~/.bash_profile; sudo service kafkaconnect start'
+  su ec2-user -c 'sudo python /tmp/install-kafka_connect/jvm_profile.py connect verify' || true
+  # apply any connector definitions that have changed
+  su ec2-user -c 'source ~/.bash_profile; python /tmp/install-kafka_connect/connector_manager.py /opt/kafka/config/connectors'
+  break
 fi
 done
 echo END
\ No newline at end of file
@@ -0,0 +1,72 @@
+import json
+import re
+import sys
+import boto3
+
+# Migrates a *-state DynamoDB table from the old single-item layout
+# (one item keyed state_name holding every kafkaN/zookeeperN/... IP) to the
+# per-slot layout (partition key cluster, sort key slot, one item per node).
+#
+# Changing the table keys makes Terraform replace the table, so:
+#   python migrate_state.py export kafka-state kafka-state.json   (before terraform apply)
+#   python migrate_state.py import kafka-state kafka-state.json   (after terraform apply)
+
+FREE_IP = '0.0.0.0'
+
+def getCluster(tablename):
+    # the tables are named <cluster>-state, e.g. kafka_connect-state
+    return tablename[:-len('-state')]
+
+def exportState(client, tablename, filename):
+    cluster = getCluster(tablename)
+    response = client.get_item(
+        Key={
+            'state_name': {'S':cluster}
+        },
+        TableName=tablename,
+        ConsistentRead=True
+    )
+    item = response.get('Item', {})
+    print('the state stored in the dynamodb table is: '+str(item))
+
+    # keep only the node slots, the changed/nodes/semaphore bookkeeping isn't migrated
+    slots = {}
+    for key in item:
+        if re.match('^'+re.escape(cluster)+r'\d+$', key):
+            slots[key] = item[key]['S']
+
+    with open(filename, 'w') as f:
+        json.dump({'cluster':cluster, 'slots':slots}, f, indent=2, sort_keys=True)
+    print('exported '+str(len(slots))+' slots to '+filename)
+
+def importState(client, tablename, filename):
+    with open(filename, 'r') as f:
+        data = json.load(f)
+
+    count = 0
+    for slot in sorted(data['slots']):
+        ip = data['slots'][slot]
+        if ip == FREE_IP:
+            continue
+        client.put_item(
+            Item={
+                'cluster': {'S':data['cluster']},
+                'slot': {'S':slot},
+                'ip': {'S':ip}
+            },
+            TableName=tablename
+        )
+        count += 1
+    print('imported '+str(count)+' slots into '+tablename)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ['export', 'import']:
+        print("Usage: "+sys.argv[0]+" {export|import} <table name> <file>")
+        sys.exit(1)
+
+    session = boto3.Session(profile_name='terraform')
+    client = session.client('dynamodb')
+    if sys.argv[1] == 'export':
+        exportState(client, sys.argv[2], sys.argv[3])
+    else:
+        importState(client, sys.argv[2], sys.argv[3])
@@ -163,6 +163,7 @@ sed -i -- 's/<your .pem file>/'"$pem_file"'/g' $path/Packer/Consul/install-consu
 sed -i -- 's/<your .pem file>/'"$pem_file"'/g' $path/Packer/Vault/install-vault/conf_vault.py
 sed -i -- 's/<your .pem file>/'"$pem_file"'/g' $path/Packer/Management\ Tools/install-tools/conf_tools.py
 sed -i -- 's/<your .pem file>/'"$pem_file"'/g' $path/Packer/Kafka/install-kafka/conf_kafka.py
+sed -i -- 's/<your .pem file>/'"$pem_file"'/g' $path/Packer/Kafka/install-kafka/rolling_restart.py
 sed -i -- 's/<your .pem file>/'"$pem_file"'/g' $path/Packer/Kafka\ Connect/install-kafka_connect/conf_kafka_connect.py
 
 sed -i -- 's/<Access key for user allowed to assume role defined in Terraform>/'"$aws_access_key"'/g' $path/Packer/Consul/run-consul/run-consul
@@ -0,0 +1,199 @@
+import os
+import sys
+import threading
+
+PACKER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Packer')
+
+def useRole(directory):
+    # put a role's scripts first on the path, e.g. useRole('Kafka/install-kafka')
+    path = os.path.join(PACKER, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+class FakeClock(object):
+    # stands in for the time module, sleeping just moves the clock on
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class FakePaginator(object):
+    def __init__(self, table):
+        self.table = table
+
+    def paginate(self, TableName, KeyConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues, ConsistentRead):
+        cluster = ExpressionAttributeValues[':cluster']['S']
+        items = [dict(item) for key, item in sorted(self.table.items.items()) if key[0] == cluster]
+        return [{'Items': items}]
+
+class FakeDynamoDB(object):
+    # an in-memory *-state table keyed by (cluster, slot), whose conditional updates are
+    # atomic like DynamoDB's; only the condition expressions state_table uses are known
+    def __init__(self, items=None):
+        self.items = {}
+        self.lock = threading.Lock()
+        self.failedConditions = 0
+        for item in items or []:
+            self.items[(item['cluster']['S'], item['slot']['S'])] = dict(item)
+
+    def get_paginator(self, operation):
+        return FakePaginator(self)
+
+    def checkCondition(self, item, condition, values):
+        ip = item.get('ip', {}).get('S')
+        if condition is None:
+            return True
+        if condition == 'attribute_not_exists(ip) OR ip = :free':
+            return ip is None or ip == values[':free']['S']
+        if condition == 'ip = :old':
+            return ip == values[':old']['S']
+        owner = item.get('lease_owner', {}).get('S')
+        if condition == 'attribute_not_exists(lease_owner) OR lease_owner = :owner OR expires < :now':
+            return owner is None or owner == values[':owner']['S'] or int(item['expires']['N']) < int(values[':now']['N'])
+        if condition == 'lease_owner = :owner':
+            return owner == values[':owner']['S']
+        raise Exception('unknown condition '+condition)
+
+    def update_item(self, Key, TableName, UpdateExpression, ExpressionAttributeValues, ReturnValues=None,
+                    ConditionExpression=None, ExpressionAttributeNames=None):
+        key = (Key['cluster']['S'], Key['slot']['S'])
+        with self.lock:
+            item = dict(self.items.get(key, Key))
+            if not self.checkCondition(item, ConditionExpression, ExpressionAttributeValues):
+                self.failedConditions += 1
+                raise clientError('ConditionalCheckFailedException', 'UpdateItem')
+            for assignment in UpdateExpression[len('SET '):].split(','):
+                name, value = [part.strip() for part in assignment.split('=')]
+                item[(ExpressionAttributeNames or {}).get(name, name)] = ExpressionAttributeValues[value]
+            self.items[key] = item
+            return {'Attributes': dict(item)}
+
+    def delete_item(self, Key, TableName, ConditionExpression=None, ExpressionAttributeValues=None):
+        key = (Key['cluster']['S'], Key['slot']['S'])
+        with self.lock:
+            if not self.checkCondition(self.items.get(key, {}), ConditionExpression, ExpressionAttributeValues):
+                self.failedConditions += 1
+                raise clientError('ConditionalCheckFailedException', 'DeleteItem')
+            self.items.pop(key, None)
+
+def clientError(code, operation):
+    import botocore.exceptions
+    return botocore.exceptions.ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+class FakeEC2(object):
+    # EBS volumes and instances whose attachments change state straight away, unless a
+    # volume is listed in stuck (never detaches) or an operation is listed in failures
+    def __init__(self):
+        self.volumes = {}
+        self.instances = {}
+        self.calls = []
+        self.stuck = set()
+        self.failures = {}
+
+    def addInstance(self, instanceId, state='running'):
+        self.instances[instanceId] = state
+
+    def addVolume(self, volumeId, az, instanceId=None, device=None):
+        attachments = []
+        if instanceId is not None:
+            attachments.append({'InstanceId': instanceId, 'Device': device, 'State': 'attached'})
+        self.volumes[volumeId] = {'VolumeId': volumeId, 'AvailabilityZone': az, 'State': 'in-use' if attachments else 'available',
+                                  'Attachments': attachments}
+
+    def getDevice(self, instanceId, device):
+        for volume in self.volumes.values():
+            for attachment in volume['Attachments']:
+                if attachment['InstanceId'] == instanceId and attachment['Device'] == device:
+                    return volume['VolumeId']
+        return None
+
+    def fail(self, operation, volumeId):
+        if (operation, volumeId) in self.failures:
+            raise clientError(self.failures[(operation, volumeId)], operation)
+
+    def describe_volumes(self, VolumeIds):
+        if VolumeIds[0] not in self.volumes:
+            raise clientError('InvalidVolume.NotFound', 'DescribeVolumes')
+        return {'Volumes': [self.volumes[VolumeIds[0]]]}
+
+    def describe_instances(self, InstanceIds):
+        instanceId = InstanceIds[0]
+        if instanceId not in self.instances:
+            raise clientError('InvalidInstanceID.NotFound', 'DescribeInstances')
+        mappings = []
+        for volume in self.volumes.values():
+            for attachment in volume['Attachments']:
+                if attachment['InstanceId'] == instanceId:
+                    mappings.append({'DeviceName': attachment['Device'], 'Ebs': {'VolumeId': volume['VolumeId']}})
+        return {'Reservations': [{'Instances': [{'InstanceId': instanceId, 'State': {'Name': self.instances[instanceId]},
+                                                 'BlockDeviceMappings': mappings}]}]}
+
+    def attach_volume(self, VolumeId, InstanceId, Device):
+        self.calls.append(('attach', VolumeId))
+        self.fail('attach', VolumeId)
+        self.volumes[VolumeId]['Attachments'] = [{'InstanceId': InstanceId, 'Device': Device, 'State': 'attached'}]
+        self.volumes[VolumeId]['State'] = 'in-use'
+
+    def detach_volume(self, VolumeId, InstanceId, Force=False):
+        self.calls.append(('detach', VolumeId))
+        if VolumeId in self.stuck and not Force:
+            return
+        self.volumes[VolumeId]['Attachments'] = []
+        self.volumes[VolumeId]['State'] = 'available'
+
+    def delete_volume(self, VolumeId):
+        self.calls.append(('delete', VolumeId))
+        if self.volumes[VolumeId]['Attachments']:
+            raise clientError('VolumeInUse', 'DeleteVolume')
+        del self.volumes[VolumeId]
+
+    def modify_instance_attribute(self, InstanceId, BlockDeviceMappings):
+        self.calls.append(('keep', InstanceId))
+
+class FakeTagPaginator(object):
+    def __init__(self, ec2):
+        self.ec2 = ec2
+
+    def paginate(self, Filters):
+        # like EC2, a filter takes at most 200 values
+        values = dict((f['Name'], f['Values']) for f in Filters)
+        for name in values:
+            if len(values[name]) > 200:
+                raise clientError('FilterLimitExceeded', 'DescribeTags')
+        self.ec2.tagCalls += 1
+        tags = [{'ResourceId': instanceId, 'Key': 'Name', 'Value': self.ec2.tags[instanceId]}
+                for instanceId in values['resource-id'] if instanceId in self.ec2.tags]
+        # a page per 100 tags
+        return [{'Tags': tags[index:index+100]} for index in range(0, max(len(tags), 1), 100)]
+
+class FakeTagEC2(object):
+    # the Name tags of instances, which can be set as a test goes along
+    def __init__(self, tags=None):
+        self.tags = dict(tags or {})
+        self.tagCalls = 0
+
+    def get_paginator(self, operation):
+        return FakeTagPaginator(self)
+
+class FakeAutoScaling(object):
+    def __init__(self, state='Pending'):
+        self.state = state
+
+    def describe_auto_scaling_instances(self, InstanceIds):
+        if self.state is None:
+            return {'AutoScalingInstances': []}
+        return {'AutoScalingInstances': [{'InstanceId': InstanceIds[0], 'LifecycleState': self.state}]}
+
+class FakeSession(object):
+    # a boto3 session handing out the given clients by service name
+    def __init__(self, **clients):
+        self.clients = clients
+
+    def client(self, service, region_name=None):
+        return self.clients[service]
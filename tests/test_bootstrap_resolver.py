@@ -0,0 +1,42 @@
+import threading
+import unittest
+from fakes import useRole
+
+useRole('Kafka Connect/install-kafka_connect')
+import bootstrap_resolver
+
+class CheckBrokersTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = [bootstrap_resolver.checkBroker, bootstrap_resolver.CONNECT_TIMEOUT]
+        bootstrap_resolver.CONNECT_TIMEOUT = 0.05
+
+    def tearDown(self):
+        bootstrap_resolver.checkBroker, bootstrap_resolver.CONNECT_TIMEOUT = self.saved
+
+    def testSlowCheckDoesNotChangeTheResult(self):
+        release = threading.Event()
+        finished = threading.Event()
+
+        def checkBroker(address):
+            if address == '10.0.0.2':
+                # still running after the join gives up on it
+                release.wait(5)
+                finished.set()
+                return 0.5
+            return 1.0
+        bootstrap_resolver.checkBroker = checkBroker
+
+        brokers = {'kafka1': {'ip':'10.0.0.1', 'az':'a'}, 'kafka2': {'ip':'10.0.0.2', 'az':'a'}}
+        checked = bootstrap_resolver.checkBrokers(brokers)
+        self.assertEqual(checked['kafka1']['latency'], 1.0)
+        self.assertIsNone(checked['kafka2']['latency'])
+
+        release.set()
+        self.assertTrue(finished.wait(5))
+        # the late answer lands after the copy, so the order is still based on the same latencies
+        self.assertIsNone(checked['kafka2']['latency'])
+        self.assertNotIn('latency', brokers['kafka2'])
+        self.assertEqual(bootstrap_resolver.orderBrokers(checked, 'a'), ['kafka1'])
+
+if __name__ == '__main__':
+    unittest.main()
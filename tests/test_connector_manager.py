@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+from fakes import FakeDynamoDB, useRole
+
+useRole('Kafka Connect/install-kafka_connect')
+import connector_manager
+
+class FakeResponse(object):
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+
+    def read(self):
+        return self.body.encode('utf-8')
+
+class FakeConnection(object):
+    # records every host and port connected to, answering like a worker with no connectors
+    connected = []
+
+    def __init__(self, host, port, timeout=None):
+        FakeConnection.connected.append((host, port))
+
+    def request(self, method, path, body=None, headers=None):
+        self.path = path
+
+    def getresponse(self):
+        return FakeResponse(200, '[]')
+
+    def close(self):
+        pass
+
+class RestEndpointTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.workerProperties = os.path.join(self.directory, 'worker.properties')
+        self.connection = connector_manager.http_client.HTTPConnection
+        connector_manager.http_client.HTTPConnection = FakeConnection
+        FakeConnection.connected = []
+
+    def tearDown(self):
+        connector_manager.http_client.HTTPConnection = self.connection
+        shutil.rmtree(self.directory)
+
+    def writeWorkerProperties(self, lines):
+        with open(self.workerProperties, 'w') as f:
+            f.write('\n'.join(lines)+'\n')
+
+    def testUsesTheBoundHostAndPort(self):
+        self.writeWorkerProperties(['rest.host.name=kafka_connect2', 'rest.port=8093'])
+        self.assertEqual(connector_manager.getRestEndpoint(self.workerProperties), ['kafka_connect2', 8093])
+
+    def testFallsBackToThePrivateIp(self):
+        self.writeWorkerProperties(['rest.host.name=', 'bootstrap.servers=kafka1:9092'])
+        endpoint = connector_manager.getRestEndpoint(self.workerProperties, lambda: {'privateIp': '10.0.1.7'})
+        self.assertEqual(endpoint, ['10.0.1.7', connector_manager.DEFAULT_REST_PORT])
+
+    def testApplyConnectsToTheWorkersHost(self):
+        self.writeWorkerProperties(['rest.host.name=kafka_connect1', 'rest.port=8083'])
+        connectors = os.path.join(self.directory, 'connectors')
+        os.mkdir(connectors)
+        client = FakeDynamoDB([{'cluster': {'S': 'kafka_connect'}, 'slot': {'S': 'kafka_connect1'}, 'ip': {'S': '10.0.1.5'}}])
+        changed, extra = connector_manager.apply(client, connectors, True, self.workerProperties)
+        self.assertEqual([changed, extra], [[], []])
+        self.assertTrue(FakeConnection.connected)
+        self.assertEqual(set(FakeConnection.connected), set([('kafka_connect1', 8083)]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from fakes import useRole
+
+useRole('Kafka/install-kafka')
+import instance_metadata
+
+TOKEN = 'fake-token'
+IDENTITY = {'privateIp': '10.0.1.5', 'instanceId': 'i-0123', 'region': 'eu-west-1', 'availabilityZone': 'eu-west-1a'}
+
+class MetadataHandler(BaseHTTPRequestHandler):
+    # the IMDSv2 token and identity document endpoints, recording every request
+    protocol_version = 'HTTP/1.1'
+
+    def reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode('utf-8'))
+
+    def do_PUT(self):
+        self.server.requests.append(('PUT', self.path))
+        if self.path == '/latest/api/token' and self.headers.get('X-aws-ec2-metadata-token-ttl-seconds'):
+            self.reply(200, TOKEN)
+        else:
+            self.reply(400, '')
+
+    def do_GET(self):
+        self.server.requests.append(('GET', self.path))
+        if self.headers.get('X-aws-ec2-metadata-token') != TOKEN:
+            self.reply(401, '')
+        elif self.path == '/latest/dynamic/instance-identity/document':
+            self.reply(200, json.dumps(IDENTITY))
+        else:
+            self.reply(404, '')
+
+    def log_message(self, format, *args):
+        pass
+
+class InstanceMetadataTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), MetadataHandler)
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.directory = tempfile.mkdtemp()
+        self.saved = dict((name, getattr(instance_metadata, name)) for name in
+                          ['METADATA_HOST', 'METADATA_PORT', 'CACHE_FILE', 'BOOT_ID_FILE'])
+        instance_metadata.METADATA_HOST = '127.0.0.1'
+        instance_metadata.METADATA_PORT = self.server.server_address[1]
+        instance_metadata.CACHE_FILE = os.path.join(self.directory, 'instance-identity.json')
+        instance_metadata.BOOT_ID_FILE = os.path.join(self.directory, 'boot_id')
+        self.setBootId('boot-1')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        for name in self.saved:
+            setattr(instance_metadata, name, self.saved[name])
+        shutil.rmtree(self.directory)
+
+    def setBootId(self, bootId):
+        with open(instance_metadata.BOOT_ID_FILE, 'w') as f:
+            f.write(bootId+'\n')
+
+    def testOneTokenRequestAndOneDocumentRequest(self):
+        self.assertEqual(instance_metadata.getIdentity(), IDENTITY)
+        self.assertEqual(self.server.requests, [('PUT', '/latest/api/token'), ('GET', '/latest/dynamic/instance-identity/document')])
+
+    def testCacheIsReusedWithinABoot(self):
+        instance_metadata.getIdentity()
+        self.assertEqual(instance_metadata.getIdentity(), IDENTITY)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def testCacheIsIgnoredAfterAReboot(self):
+        instance_metadata.getIdentity()
+        self.setBootId('boot-2')
+        self.assertEqual(instance_metadata.getIdentity(), IDENTITY)
+        self.assertEqual(len(self.server.requests), 4)
+        with open(instance_metadata.CACHE_FILE, 'r') as f:
+            self.assertEqual(json.load(f)['bootId'], 'boot-2')
+
+if __name__ == '__main__':
+    unittest.main()
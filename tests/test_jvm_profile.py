@@ -0,0 +1,47 @@
+import contextlib
+import io
+import sys
+import unittest
+from fakes import useRole
+
+useRole('Kafka/install-kafka')
+import jvm_profile
+
+MB = jvm_profile.MB
+GB = jvm_profile.GB
+
+@contextlib.contextmanager
+def capturedOutput():
+    saved = sys.stdout
+    sys.stdout = io.StringIO() if sys.version_info[0] >= 3 else io.BytesIO()
+    try:
+        yield sys.stdout
+    finally:
+        sys.stdout = saved
+
+class HeapSizeTest(unittest.TestCase):
+    def testMinimumIsCappedAtTheOsReserve(self):
+        # 1GB instance: the 1GB kafka minimum would leave nothing to the OS
+        with capturedOutput() as output:
+            heapMb = jvm_profile.getHeapMb('kafka', 1*GB)
+        self.assertEqual(heapMb, 512)
+        self.assertLessEqual(heapMb*MB, 1*GB - jvm_profile.OS_RESERVE_BYTES)
+        self.assertIn('warning: kafka minimum heap of 1024MB', output.getvalue())
+
+    def testMinimumAppliesWhenThereIsRoom(self):
+        # 2GB instance: a quarter is 512MB, raised to the 1GB minimum without a warning
+        with capturedOutput() as output:
+            heapMb = jvm_profile.getHeapMb('kafka', 2*GB)
+        self.assertEqual(heapMb, 1024)
+        self.assertEqual(output.getvalue(), '')
+
+    def testNeverExceedsTheOsReserveOnAnyRole(self):
+        with capturedOutput():
+            for role in jvm_profile.ROLES:
+                for memoryMb in range(768, 64*1024, 256):
+                    heapMb = jvm_profile.getHeapMb(role, memoryMb*MB)
+                    self.assertLessEqual(heapMb*MB, memoryMb*MB - jvm_profile.OS_RESERVE_BYTES, role+' '+str(memoryMb))
+                    self.assertLessEqual(heapMb*MB, jvm_profile.ROLES[role]['maxHeapBytes'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from fakes import FakeClock, useRole
+
+useRole('Kafka/install-kafka')
+import kafka_supervisor
+
+class FakeProcess(object):
+    # a broker that ignores SIGTERM, and optionally SIGKILL or leaves its port bound
+    def __init__(self, survivesKill=False, holdsPort=False):
+        self.alive = True
+        self.survivesKill = survivesKill
+        self.holdsPort = holdsPort
+        self.signals = []
+
+    def kill(self, pid, sig):
+        self.signals.append(sig)
+        if sig == kafka_supervisor.signal.SIGKILL and not self.survivesKill:
+            self.alive = False
+
+class RestartTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.starts = []
+        self.saved = dict((name, getattr(kafka_supervisor, name)) for name in
+                          ['time', 'findPid', 'isAlive', 'isListening', 'removePidfile', 'isCleanShutdown', 'start', 'os'])
+        kafka_supervisor.time = self.clock
+        kafka_supervisor.removePidfile = lambda role: None
+        kafka_supervisor.isCleanShutdown = lambda role: False
+        kafka_supervisor.start = lambda role: self.starts.append(role) or 0
+
+    def tearDown(self):
+        for name in self.saved:
+            setattr(kafka_supervisor, name, self.saved[name])
+
+    def useProcess(self, process):
+        class FakeOs(object):
+            kill = staticmethod(process.kill)
+        kafka_supervisor.os = FakeOs
+        kafka_supervisor.findPid = lambda role: 4321 if process.alive else None
+        kafka_supervisor.isAlive = lambda pid: process.alive
+        kafka_supervisor.isListening = lambda port: process.alive or process.holdsPort
+
+    def testRestartsOnceTheOldProcessIsKilled(self):
+        self.useProcess(FakeProcess())
+        self.assertEqual(kafka_supervisor.restart('kafka'), 0)
+        self.assertEqual(self.starts, ['kafka'])
+
+    def testDoesNotStartWhileTheOldProcessSurvives(self):
+        process = FakeProcess(survivesKill=True)
+        self.useProcess(process)
+        self.assertEqual(kafka_supervisor.restart('kafka'), 1)
+        self.assertEqual(process.signals, [kafka_supervisor.signal.SIGTERM, kafka_supervisor.signal.SIGKILL])
+        self.assertEqual(self.starts, [])
+
+    def testDoesNotStartWhileThePortIsBound(self):
+        self.useProcess(FakeProcess(holdsPort=True))
+        self.assertEqual(kafka_supervisor.restart('kafka'), 1)
+        self.assertEqual(self.starts, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+import importlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from fakes import useRole
+
+useRole('Kafka/install-kafka')
+import partition_rebalancer
+
+BENCHMARK_PARTITIONS = 100000
+BENCHMARK_BROKERS = 12
+
+def makeDump(brokers, partitions, racks=None, sizes=None, replication=3, seed=1):
+    # partitions spread over the given brokers, with optional racks and sizes
+    rng = random.Random(seed)
+    dump = {'brokers': {}, 'partitions': []}
+    for broker in brokers:
+        dump['brokers'][str(broker)] = {'rack': racks[broker] if racks else None}
+    for index in range(partitions):
+        partition = {'topic': 't'+str(index // 10), 'partition': index % 10, 'replicas': rng.sample(brokers, replication)}
+        if sizes is not None:
+            partition['size'] = sizes(rng)
+        dump['partitions'].append(partition)
+    return dump
+
+def applyPlan(dump, reassignment):
+    moved = dict(((p['topic'], p['partition']), p['replicas']) for p in reassignment['partitions'])
+    return [dict(p, replicas=moved.get((p['topic'], p['partition']), p['replicas'])) for p in dump['partitions']]
+
+def getLoads(dump, partitions, sized=True):
+    loads = dict((int(broker), 0) for broker in dump['brokers'])
+    for partition in partitions:
+        for broker in partition['replicas']:
+            loads[broker] += partition['size'] if sized else 1
+    return loads
+
+class PlanTest(unittest.TestCase):
+    def testNewBrokerGetsAnEvenShareOfTheBytes(self):
+        # small and large partitions on three brokers, and an empty new broker
+        dump = makeDump([1, 2, 3], 60, sizes=lambda rng: rng.choice([5, 50, 500, 5000]))
+        dump['brokers']['4'] = {'rack': None}
+        reassignment, summary = partition_rebalancer.plan(dump)
+        loads = getLoads(dump, applyPlan(dump, reassignment))
+        mean = sum(loads.values()) / 4.0
+        largest = max(p['size'] for p in dump['partitions'])
+        for broker in loads:
+            self.assertLessEqual(abs(loads[broker] - mean), largest, str(loads))
+        self.assertGreater(loads[4], mean / 2)
+        self.assertEqual(summary['bytes_moved'], loads[4])
+
+    def testWithoutSizesEveryBrokerHoldsTheSameNumberOfReplicas(self):
+        dump = makeDump(list(range(1, 12)), 1000)
+        dump['brokers']['12'] = {'rack': None}
+        reassignment, summary = partition_rebalancer.plan(dump)
+        loads = getLoads(dump, applyPlan(dump, reassignment), sized=False)
+        self.assertEqual(set(loads.values()), set([250]))
+        self.assertEqual(summary['replicas_moved'], 250)
+
+    def testReplicasStayInDifferentRacks(self):
+        racks = {1: 'a', 2: 'b', 3: 'c', 4: 'a', 5: 'b', 6: 'c'}
+        dump = {'brokers': dict((str(broker), {'rack': racks[broker]}) for broker in racks), 'partitions': []}
+        rng = random.Random(3)
+        for index in range(300):
+            replicas = [rng.choice([1, 4]), rng.choice([2, 5]), 3]
+            rng.shuffle(replicas)
+            dump['partitions'].append({'topic': 't', 'partition': index, 'replicas': replicas, 'size': rng.randint(1, 1000)})
+        reassignment, summary = partition_rebalancer.plan(dump)
+        partitions = applyPlan(dump, reassignment)
+        for partition in partitions:
+            self.assertEqual(len(set(racks[broker] for broker in partition['replicas'])), 3)
+        loads = getLoads(dump, partitions)
+        self.assertLessEqual(abs(loads[3] - loads[6]), 1000)
+
+    def testLeadersAreEvenedOut(self):
+        dump = makeDump([1, 2, 3, 4], 200)
+        for partition in dump['partitions']:
+            partition['replicas'].sort()
+        reassignment, summary = partition_rebalancer.plan(dump)
+        leaders = {}
+        for partition in applyPlan(dump, reassignment):
+            leaders[partition['replicas'][0]] = leaders.get(partition['replicas'][0], 0) + 1
+        self.assertLessEqual(max(leaders.values()) - min(leaders.values()), 1)
+
+    def testPlansWithoutKazoo(self):
+        saved = dict((name, module) for name, module in sys.modules.items() if name.split('.')[0] == 'kazoo')
+        try:
+            sys.modules['kazoo'] = None
+            sys.modules['kazoo.client'] = None
+            module = importlib.reload(partition_rebalancer)
+            self.assertEqual(module.plan(makeDump([1, 2, 3], 10))[1]['partitions'], 10)
+        finally:
+            for name in ['kazoo', 'kazoo.client']:
+                del sys.modules[name]
+            sys.modules.update(saved)
+            importlib.reload(partition_rebalancer)
+
+    def testPlanCommandPrintsOnlyJson(self):
+        # the output is handed straight to kafka-reassign-partitions, so the metric goes to stderr
+        dump = makeDump([1, 2, 3], 30)
+        dump['brokers']['4'] = {'rack': None}
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump(dump, f)
+        try:
+            command = subprocess.Popen([sys.executable, partition_rebalancer.__file__, 'plan', f.name],
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr = command.communicate()
+        finally:
+            os.remove(f.name)
+        self.assertEqual(command.returncode, 0, stderr)
+        reassignment = json.loads(stdout.decode('utf-8'))
+        self.assertEqual(reassignment['version'], 1)
+        self.assertTrue(reassignment['partitions'])
+        self.assertIn('metric rebalance_plan ', stderr.decode('utf-8'))
+
+    def testBenchmarkHundredThousandPartitions(self):
+        brokers = list(range(1, BENCHMARK_BROKERS + 1))
+        dump = makeDump(brokers, BENCHMARK_PARTITIONS, sizes=lambda rng: rng.randint(1, 10000))
+        dump['brokers'][str(BENCHMARK_BROKERS + 1)] = {'rack': None}
+        started = time.time()
+        reassignment, summary = partition_rebalancer.plan(dump)
+        seconds = time.time() - started
+        print('metric rebalance_plan_benchmark partitions='+str(BENCHMARK_PARTITIONS)+' brokers='+str(BENCHMARK_BROKERS + 1)+
+              ' moved='+str(len(reassignment['partitions']))+' seconds='+('%.3f' % seconds))
+        self.assertEqual(summary['partitions'], BENCHMARK_PARTITIONS)
+        loads = getLoads(dump, applyPlan(dump, reassignment))
+        mean = sum(loads.values()) / float(len(loads))
+        largest = max(p['size'] for p in dump['partitions'])
+        for broker in loads:
+            self.assertLessEqual(abs(loads[broker] - mean), largest, str(loads))
+        # generous, so a slow CI machine doesn't fail it
+        self.assertLess(seconds, 60)
+
+class FakeZooKeeper(object):
+    def __init__(self, paths):
+        self.paths = paths
+
+    def exists(self, path):
+        return {} if path in self.paths else None
+
+    def stop(self):
+        pass
+
+class RebalanceTest(unittest.TestCase):
+    def setUp(self):
+        self.dumps = []
+        self.commands = []
+        self.executes = []
+        self.saved = dict((name, getattr(partition_rebalancer, name)) for name in
+                          ['getZookeeperConnect', 'connect', 'dumpAssignments', 'runTool'])
+        partition_rebalancer.getZookeeperConnect = lambda: 'zookeeper1:2181/kafka'
+        partition_rebalancer.connect = lambda zookeeperConnect: FakeZooKeeper(['/brokers/ids/4'])
+        partition_rebalancer.dumpAssignments = lambda zk: self.dumps.pop(0)
+        partition_rebalancer.runTool = self.runTool
+
+    def tearDown(self):
+        for name in self.saved:
+            setattr(partition_rebalancer, name, self.saved[name])
+
+    def runTool(self, args):
+        self.commands.append(args)
+        if '--execute' in args:
+            return self.executes.pop(0)
+        return 'Reassignment of partition t-0 completed successfully'
+
+    def makeDump(self):
+        dump = makeDump([1, 2, 3], 30)
+        dump['brokers']['4'] = {'rack': None}
+        return dump
+
+    def testPlansAgainWhenAnotherReassignmentStartsFirst(self):
+        self.dumps = [self.makeDump(), self.makeDump()]
+        self.executes = ['There is an existing assignment running.', partition_rebalancer.STARTED+' of partitions.']
+        self.assertTrue(partition_rebalancer.rebalance(4))
+        self.assertEqual(len([args for args in self.commands if '--execute' in args]), 2)
+        self.assertEqual(self.dumps, [])
+
+    def testLeavesAReplacementBrokerAlone(self):
+        dump = self.makeDump()
+        dump['partitions'][0]['replicas'][0] = 4
+        self.dumps = [dump]
+        self.assertTrue(partition_rebalancer.rebalance(4))
+        self.assertEqual(self.commands, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import time
+import unittest
+from fakes import useRole
+
+useRole('Consul/install-consul')
+import replaceAll
+
+BENCHMARK_LINES = 100000
+BENCHMARK_PAIRS = 1000
+
+class ReplaceLinesTest(unittest.TestCase):
+    def testReplacesEveryOccurrence(self):
+        lines = ['0.0.0.0 kafka1\n', 'listen 0.0.0.0 kafka1\n']
+        newLines, changed = replaceAll.replaceLines(lines, [('0.0.0.0 kafka1', '10.0.0.1 kafka1')])
+        self.assertTrue(changed)
+        self.assertEqual(newLines, ['10.0.0.1 kafka1\n', 'listen 10.0.0.1 kafka1\n'])
+
+    def testPairsSharingATrailingTokenAreBothApplied(self):
+        pairs = [('0.0.0.0 zookeeper', '10.0.1.1 zookeeper'), ('0.0.0.1 zookeeper', '10.0.1.2 zookeeper')]
+        # neither search expression is there, and one line ends with the shared token
+        newLines, changed = replaceAll.replaceLines(['127.0.0.1 localhost\n', '10.0.9.9 zookeeper\n'], pairs)
+        self.assertEqual(newLines, ['127.0.0.1 localhost\n', '10.0.1.1 zookeeper\n', '10.0.1.2 zookeeper\n'])
+        # no line ends with it, so both are appended in order
+        newLines, changed = replaceAll.replaceLines(['127.0.0.1 localhost'], pairs)
+        self.assertEqual(newLines, ['127.0.0.1 localhost\n', '10.0.1.1 zookeeper\n', '10.0.1.2 zookeeper\n'])
+
+    def testUnchangedFile(self):
+        lines = ['10.0.0.1 kafka1\n']
+        self.assertEqual(replaceAll.replaceLines(lines, [('10.0.0.1 kafka1', '10.0.0.1 kafka1')]), [lines, False])
+
+    def testBenchmarkHundredThousandLines(self):
+        # a hosts-style file with a batch of pairs that are present, have moved and are new
+        lines = ['10.0.'+str(index // 250)+'.'+str(index % 250)+' host'+str(index)+'\n' for index in range(BENCHMARK_LINES)]
+        pairs = []
+        for index in range(0, BENCHMARK_LINES, BENCHMARK_LINES // BENCHMARK_PAIRS):
+            if index % 3 == 0:
+                pairs.append((lines[index].strip(), '10.1.0.1 host'+str(index)))
+            elif index % 3 == 1:
+                pairs.append(('0.0.0.0 host'+str(index), '10.1.0.2 host'+str(index)))
+            else:
+                pairs.append(('0.0.0.0 new'+str(index), '10.1.0.3 new'+str(index)))
+        started = time.time()
+        newLines, changed = replaceAll.replaceLines(lines, pairs)
+        seconds = time.time() - started
+        print('metric replace_lines lines='+str(BENCHMARK_LINES)+' pairs='+str(len(pairs))+' seconds='+('%.3f' % seconds))
+        self.assertTrue(changed)
+        self.assertEqual(len(newLines), BENCHMARK_LINES + len([p for p in pairs if ' new' in p[0]]))
+        written = set(newLines)
+        for searchExp, replaceExp in pairs:
+            self.assertIn(replaceExp+'\n', written)
+        self.assertLess(seconds, 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from fakes import FakeClock, FakeDynamoDB, useRole
+
+useRole('Kafka/install-kafka')
+import rolling_restart
+
+LEASE = ('kafka', 'restart-lease')
+
+class RollingRestartTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.client = FakeDynamoDB()
+        self.restarted = []
+        self.saved = {'time': rolling_restart.time, 'isListening': rolling_restart.isListening,
+                      'runOnHosts': rolling_restart.ssh_fanout.runOnHosts}
+        rolling_restart.time = self.clock
+        rolling_restart.isListening = lambda address: True
+        rolling_restart.ssh_fanout.runOnHosts = self.runOnHosts
+
+    def tearDown(self):
+        rolling_restart.time = self.saved['time']
+        rolling_restart.isListening = self.saved['isListening']
+        rolling_restart.ssh_fanout.runOnHosts = self.saved['runOnHosts']
+
+    def runOnHosts(self, hosts, command, keyFile):
+        self.restarted.extend(sorted(hosts))
+        return dict((name, {'address': hosts[name], 'error': None}) for name in hosts)
+
+    def slowReplication(self, seconds, during=None):
+        # under-replicated partitions until the given number of seconds has passed since
+        # the broker restarted, calling during() on each poll
+        state = {'restarts': 0, 'restarted': None}
+        def getUrp():
+            if during is not None:
+                during()
+            if len(self.restarted) > state['restarts']:
+                state['restarts'] = len(self.restarted)
+                state['restarted'] = self.clock.now
+            if state['restarted'] is None:
+                return 0
+            return 0 if self.clock.now - state['restarted'] >= seconds else 3
+        return getUrp
+
+    def testAnotherNodeCannotTakeTheLeaseDuringALongWait(self):
+        # the replication after each restart takes longer than the old 600s lease
+        attempts = []
+        def otherNode():
+            attempts.append(rolling_restart.acquireLease(self.client, 'kafka7'))
+        getUrp = self.slowReplication(1500, otherNode)
+        failed = rolling_restart.rollingRestart(self.client, {'kafka1': '10.0.0.1', 'kafka2': '10.0.0.2'}, 'key.pem',
+                                                'kafka5', getUrp=getUrp)
+        self.assertEqual(failed, [])
+        self.assertEqual(self.restarted, ['kafka1', 'kafka2'])
+        self.assertGreaterEqual(self.clock.now - 1000.0, 3000)
+        self.assertTrue(attempts)
+        self.assertNotIn(True, attempts)
+        # released once the restarts are done
+        self.assertNotIn(LEASE, self.client.items)
+
+    def testStopsWhenTheLeaseCannotBeRenewed(self):
+        # part way through the wait after the first restart another node ends up with the lease
+        def stolen():
+            if self.clock.now - 1000.0 > 900:
+                self.client.items[LEASE] = {'cluster': {'S': 'kafka'}, 'slot': {'S': 'restart-lease'},
+                                            'lease_owner': {'S': 'kafka7'}, 'expires': {'N': str(int(self.clock.now) + 3600)}}
+        getUrp = self.slowReplication(1500, stolen)
+        with self.assertRaises(Exception) as raised:
+            rolling_restart.rollingRestart(self.client, {'kafka1': '10.0.0.1', 'kafka2': '10.0.0.2'}, 'key.pem',
+                                           'kafka5', getUrp=getUrp)
+        self.assertIn('lost the kafka restart lease', str(raised.exception))
+        self.assertEqual(self.restarted, ['kafka1'])
+        # the other node's lease is left alone
+        self.assertEqual(self.client.items[LEASE]['lease_owner']['S'], 'kafka7')
+
+    def testLeaseOutlastsTheLongestWait(self):
+        self.assertGreater(rolling_restart.LEASE_SECONDS, max(rolling_restart.BROKER_WAIT, rolling_restart.REPLICATION_WAIT,
+                                                              rolling_restart.LEASE_WAIT))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import random
+import threading
+import time
+import unittest
+from fakes import FakeDynamoDB, useRole
+
+useRole('Kafka/install-kafka')
+import slot_allocator
+import state_table
+
+TABLENAME = 'kafka-state'
+CLUSTER = 'kafka'
+
+def slotItem(number, ip, instanceId):
+    return {'cluster': {'S': CLUSTER}, 'slot': {'S': CLUSTER+str(number)}, 'ip': {'S': ip}, 'instance': {'S': instanceId}}
+
+def claimTogether(client, launches, maxinstances, tags):
+    # claim a slot from a thread per launched instance at once, returning instance id -> slot
+    claimed = {}
+    errors = []
+    start = threading.Event()
+    def claim(instanceId, ip):
+        start.wait()
+        try:
+            slot, state = state_table.claimSlot(client, TABLENAME, CLUSTER, maxinstances, ip, lambda: dict(tags),
+                                                instanceId, sleep=lambda seconds: time.sleep(seconds/100))
+            claimed[instanceId] = slot
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=claim, args=(instanceId, ip)) for instanceId, ip in launches]
+    for thread in threads:
+        thread.start()
+    start.set()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return claimed
+
+def randomCluster(rng, maxinstances):
+    # a random mix of slots and instances, returning [state, tags, occupied] where occupied
+    # is the set of slot numbers a live or launching instance already holds
+    # - live: tagged, and its ip recorded in the state
+    # - launching: in the ASG without a tag yet, some having already claimed a slot
+    # - dead: gone from the ASG, its ip still in the state or released
+    # - never: no instance has ever claimed the slot
+    state = {'lease': {'ip': {'S': '10.0.9.9'}}}
+    tags = {}
+    occupied = set()
+    for number in range(1, maxinstances + 1):
+        kind = rng.choice(['live', 'launching', 'dead', 'released', 'never'])
+        instanceId = 'i-'+str(number)
+        if kind == 'live':
+            tags[instanceId] = number
+            state[CLUSTER+str(number)] = slotItem(number, '10.0.0.'+str(number), instanceId)
+            occupied.add(number)
+        elif kind == 'launching':
+            tags[instanceId] = None
+            if rng.random() < 0.5:
+                state[CLUSTER+str(number)] = slotItem(number, '10.0.0.'+str(number), instanceId)
+                occupied.add(number)
+        elif kind == 'dead':
+            state[CLUSTER+str(number)] = slotItem(number, '10.0.0.'+str(number), 'i-dead'+str(number))
+        elif kind == 'released':
+            state[CLUSTER+str(number)] = slotItem(number, state_table.FREE_IP, 'i-dead'+str(number))
+    # instances still launching that haven't claimed anything yet
+    for index in range(rng.randint(0, 5)):
+        tags['i-new'+str(index)] = None
+    return [state, tags, occupied]
+
+class SlotAllocatorTest(unittest.TestCase):
+    def testFreeSlotsFromFullSuffixes(self):
+        state = {}
+        for number in [1, 2, 10, 12]:
+            state[CLUSTER+str(number)] = slotItem(number, '10.0.0.'+str(number), 'i-'+str(number))
+        state[CLUSTER+'11'] = slotItem(11, state_table.FREE_IP, 'i-11')
+        self.assertEqual(slot_allocator.getFreeSlots(state, CLUSTER, 12, state_table.FREE_IP), [3, 4, 5, 6, 7, 8, 9, 11])
+
+    def testRandomGaps(self):
+        # whichever slots die, exactly those are missing, at any cluster size
+        rng = random.Random(7)
+        for trial in range(200):
+            maxinstances = rng.randint(1, 300)
+            dead = set(rng.sample(range(1, maxinstances + 1), rng.randint(0, maxinstances)))
+            tags = dict(('i-'+str(number), number) for number in range(1, maxinstances + 1) if number not in dead)
+            self.assertEqual(slot_allocator.getMissingSlots(tags, {}, CLUSTER, maxinstances), sorted(dead))
+
+    def testSpreadOrderKeepsEverySlot(self):
+        numbers = list(range(1, 51))
+        for seed in ['i-a', 'i-b', '10.0.0.1']:
+            self.assertEqual(sorted(slot_allocator.spreadOrder(numbers, seed, 10)), numbers)
+            self.assertEqual(slot_allocator.spreadOrder(numbers, seed, 10)[10:], numbers[10:])
+
+    def testRandomClustersNeverHandOutAnOccupiedSlot(self):
+        rng = random.Random(22)
+        for trial in range(500):
+            maxinstances = rng.randint(1, 120)
+            state, tags, occupied = randomCluster(rng, maxinstances)
+            held = set(number for number in range(1, maxinstances + 1) if CLUSTER+str(number) in state and
+                       state[CLUSTER+str(number)]['ip']['S'] != state_table.FREE_IP)
+
+            free = slot_allocator.getFreeSlots(state, CLUSTER, maxinstances, state_table.FREE_IP)
+            self.assertEqual(len(free), len(set(free)))
+            self.assertFalse(held & set(free))
+            self.assertEqual(set(free) | held, set(range(1, maxinstances + 1)))
+
+            missing = slot_allocator.getMissingSlots(tags, state, CLUSTER, maxinstances)
+            self.assertEqual(len(missing), len(set(missing)))
+            self.assertFalse(occupied & set(missing))
+            self.assertEqual(set(missing) | occupied, set(range(1, maxinstances + 1)))
+
+            # whatever order each launching instance tries them in, it's the same slots once each
+            window = slot_allocator.getLaunching(tags)
+            for instanceId in tags:
+                for candidates, seedWindow in [(free, window), (missing, None)]:
+                    ordered = slot_allocator.spreadOrder(candidates, instanceId, seedWindow)
+                    self.assertEqual(len(ordered), len(set(ordered)))
+                    self.assertEqual(sorted(ordered), sorted(candidates))
+
+    def testBenchmarkLargeCluster(self):
+        rng = random.Random(1)
+        maxinstances = 5000
+        state, tags, occupied = randomCluster(rng, maxinstances)
+        started = time.time()
+        for index in range(20):
+            free = slot_allocator.getFreeSlots(state, CLUSTER, maxinstances, state_table.FREE_IP)
+            missing = slot_allocator.getMissingSlots(tags, state, CLUSTER, maxinstances)
+            slot_allocator.spreadOrder(free, 'i-'+str(index), slot_allocator.getLaunching(tags))
+            slot_allocator.spreadOrder(missing, 'i-'+str(index))
+        seconds = (time.time() - started) / 20
+        print('metric slot_allocation slots='+str(maxinstances)+' seconds='+('%.4f' % seconds))
+        # every launching instance runs this once per claim attempt
+        self.assertLess(seconds, 1)
+
+class ConcurrentClaimTest(unittest.TestCase):
+    def testSimultaneousLaunchesGetDistinctSlots(self):
+        client = FakeDynamoDB()
+        launches = [('i-'+str(index), '10.0.1.'+str(index)) for index in range(1, 31)]
+        tags = dict((instanceId, None) for instanceId, ip in launches)
+        claimed = claimTogether(client, launches, 30, tags)
+        self.assertEqual(sorted(claimed.values()), sorted(CLUSTER+str(number) for number in range(1, 31)))
+        for instanceId, ip in launches:
+            self.assertEqual(client.items[(CLUSTER, claimed[instanceId])]['ip']['S'], ip)
+            self.assertEqual(client.items[(CLUSTER, claimed[instanceId])]['instance']['S'], instanceId)
+
+    def testSimultaneousReplacementsTakeTheDeadSlots(self):
+        # slots 3 and 12 die together and two replacements launch at the same time
+        items = [slotItem(number, '10.0.0.'+str(number), 'i-old'+str(number)) for number in range(1, 13)]
+        client = FakeDynamoDB(items)
+        tags = dict(('i-old'+str(number), number) for number in range(1, 13) if number not in [3, 12])
+        tags['i-new1'] = None
+        tags['i-new2'] = None
+        claimed = claimTogether(client, [('i-new1', '10.0.2.1'), ('i-new2', '10.0.2.2')], 12, tags)
+        self.assertEqual(sorted(claimed.values()), ['kafka12', 'kafka3'])
+        for number in range(1, 13):
+            if number not in [3, 12]:
+                self.assertEqual(client.items[(CLUSTER, CLUSTER+str(number))]['ip']['S'], '10.0.0.'+str(number))
+
+    def testMoreLaunchesThanSlotsFail(self):
+        client = FakeDynamoDB()
+        launches = [('i-'+str(index), '10.0.1.'+str(index)) for index in range(1, 5)]
+        tags = dict((instanceId, None) for instanceId, ip in launches)
+        with self.assertRaises(Exception):
+            claimTogether(client, launches, 3, tags)
+        self.assertEqual(len([item for item in client.items.values() if item['ip']['S'] != state_table.FREE_IP]), 3)
+
+if __name__ == '__main__':
+    unittest.main()
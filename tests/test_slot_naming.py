@@ -0,0 +1,47 @@
+import unittest
+from fakes import FakeDynamoDB, FakeSession, FakeTagEC2, useRole
+
+useRole('Kafka/install-kafka')
+import slot_allocator
+import state_table
+import tag_lookup
+
+CLUSTER = 'kafka'
+
+class SlotNamingTest(unittest.TestCase):
+    def testNameTagsAreLookedUpInChunks(self):
+        instanceIds = ['i-'+str(index) for index in range(450)]
+        ec2 = FakeTagEC2(dict((instanceId, CLUSTER+str(index+1)) for index, instanceId in enumerate(instanceIds)))
+        tags = tag_lookup.getNameTags(FakeSession(ec2=ec2), instanceIds, 'eu-west-1')
+        self.assertEqual(len(tags), 450)
+        self.assertEqual(ec2.tagCalls, 3)
+
+    def testMultiDigitSuffixes(self):
+        self.assertEqual(slot_allocator.getNodeId('kafka10', CLUSTER), 10)
+        self.assertEqual(slot_allocator.getNodeId('kafka123', CLUSTER), 123)
+        self.assertIsNone(tag_lookup.getSlotNumber('kafka', CLUSTER))
+        self.assertIsNone(tag_lookup.getSlotNumber('kafka_connect1', CLUSTER))
+        with self.assertRaises(Exception):
+            slot_allocator.getNodeId('kafka1a', CLUSTER)
+
+    def testNamesAreUniqueUpToTheAsgMaximum(self):
+        # an ASG of 250 launches one instance at a time, each tagged with the slot it claims
+        maxinstances = 250
+        nodes = [{'InstanceId': 'i-'+str(index)} for index in range(maxinstances)]
+        ec2 = FakeTagEC2(dict((node['InstanceId'], CLUSTER) for node in nodes))
+        session = FakeSession(ec2=ec2)
+        client = FakeDynamoDB()
+        for index, node in enumerate(nodes):
+            findSlots = lambda: tag_lookup.getSlots(session, nodes, CLUSTER, 'eu-west-1')
+            slot, state = state_table.claimSlot(client, 'kafka-state', CLUSTER, maxinstances, '10.0.'+str(index // 250)+'.'+str(index % 250),
+                                                findSlots, node['InstanceId'], sleep=lambda seconds: None)
+            ec2.tags[node['InstanceId']] = slot
+        names = sorted(ec2.tags.values())
+        self.assertEqual(len(set(names)), maxinstances)
+        self.assertEqual(sorted(slot_allocator.getNodeId(name, CLUSTER) for name in names), list(range(1, maxinstances + 1)))
+        # the ASG is full, so there is nothing left to claim
+        slots = tag_lookup.getSlots(session, nodes, CLUSTER, 'eu-west-1')
+        self.assertEqual(slot_allocator.getMissingSlots(slots, {}, CLUSTER, maxinstances), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import socket
+import threading
+import time
+import unittest
+from fakes import useRole
+
+useRole('Kafka/install-kafka')
+import ssh_fanout
+
+class FakeChannel(object):
+    def __init__(self, status):
+        self.status = status
+
+    def recv_exit_status(self):
+        return self.status
+
+class FakeStream(object):
+    def __init__(self, data, status=0, timeout=False):
+        self.data = data
+        self.channel = FakeChannel(status)
+        self.timeout = timeout
+
+    def read(self):
+        if self.timeout:
+            raise socket.timeout('timed out')
+        return self.data.encode('utf-8')
+
+class FakeSSHClient(object):
+    # how each address behaves: 'unreachable' times out on connect, 'failing' exits 2 and
+    # 'hanging' never finishes its command; anything else succeeds after a moment
+    lock = threading.Lock()
+    active = 0
+    mostActive = 0
+    closed = 0
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, address, **kwargs):
+        if address == 'unreachable':
+            raise socket.timeout('timed out')
+        self.address = address
+        with FakeSSHClient.lock:
+            FakeSSHClient.active += 1
+            FakeSSHClient.mostActive = max(FakeSSHClient.mostActive, FakeSSHClient.active)
+
+    def exec_command(self, command, timeout=None):
+        time.sleep(0.02)
+        if self.address == 'failing':
+            return [None, FakeStream('', 2), FakeStream('no such file')]
+        if self.address == 'hanging':
+            return [None, FakeStream('', timeout=True), FakeStream('')]
+        return [None, FakeStream('ok '+command), FakeStream('')]
+
+    def close(self):
+        with FakeSSHClient.lock:
+            FakeSSHClient.closed += 1
+            if getattr(self, 'address', None) is not None:
+                FakeSSHClient.active -= 1
+
+class FakeParamiko(object):
+    class client(object):
+        SSHClient = FakeSSHClient
+
+    class RSAKey(object):
+        @staticmethod
+        def from_private_key_file(path):
+            return 'key from '+path
+
+    @staticmethod
+    def AutoAddPolicy():
+        return None
+
+class RunOnHostsTest(unittest.TestCase):
+    def setUp(self):
+        self.paramiko = ssh_fanout.paramiko
+        ssh_fanout.paramiko = FakeParamiko
+        FakeSSHClient.active = 0
+        FakeSSHClient.mostActive = 0
+        FakeSSHClient.closed = 0
+
+    def tearDown(self):
+        ssh_fanout.paramiko = self.paramiko
+
+    def testFailuresAreReportedPerHost(self):
+        hosts = {'kafka1': '10.0.0.1', 'kafka2': 'unreachable', 'kafka3': 'failing', 'kafka4': 'hanging', 'kafka5': '10.0.0.5'}
+        results = ssh_fanout.runOnHosts(hosts, 'uptime', 'key.pem')
+        self.assertEqual(ssh_fanout.getFailures(results), ['kafka2', 'kafka3', 'kafka4'])
+        self.assertEqual(results['kafka1']['output'], 'ok uptime')
+        self.assertEqual(results['kafka1']['status'], 0)
+        self.assertIsNone(results['kafka2']['status'])
+        self.assertIn('timed out', results['kafka2']['error'])
+        self.assertEqual(results['kafka3']['status'], 2)
+        self.assertEqual(results['kafka3']['error'], 'no such file')
+        self.assertIsNone(results['kafka4']['status'])
+        self.assertIn('timed out', results['kafka4']['error'])
+        # every client is closed, whatever happened
+        self.assertEqual(FakeSSHClient.closed, len(hosts))
+
+    def testAtMostEightSessionsAtOnce(self):
+        hosts = dict(('kafka'+str(index), '10.0.0.'+str(index)) for index in range(1, 31))
+        results = ssh_fanout.runOnHosts(hosts, 'uptime', 'key.pem')
+        self.assertEqual(sorted(results), sorted(hosts))
+        self.assertEqual(ssh_fanout.getFailures(results), [])
+        self.assertEqual(FakeSSHClient.mostActive, ssh_fanout.MAX_WORKERS)
+
+    def testNoHosts(self):
+        self.assertEqual(ssh_fanout.runOnHosts({}, 'uptime', 'key.pem'), {})
+
+if __name__ == '__main__':
+    unittest.main()
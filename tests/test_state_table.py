@@ -0,0 +1,94 @@
+import threading
+import time
+import unittest
+from fakes import FakeDynamoDB, useRole
+
+useRole('Kafka/install-kafka')
+import state_table
+
+TABLENAME = 'kafka-state'
+CLUSTER = 'kafka'
+CLAIMANTS = 50
+
+class ClaimSlotTest(unittest.TestCase):
+    def claimAll(self, client, maxinstances, window, asg=None, delays=None):
+        # every claimant starts at once, recording the backoff delays it slept for
+        results = {}
+        if delays is None:
+            delays = dict((index, []) for index in range(CLAIMANTS))
+        errors = []
+        start = threading.Event()
+        def claim(index):
+            def sleep(seconds):
+                delays[index].append(seconds)
+                time.sleep(seconds / 1000)
+            start.wait()
+            try:
+                results[index] = state_table.claimSlot(client, TABLENAME, CLUSTER, maxinstances, '10.0.1.'+str(index),
+                                                       lambda: dict(asg or {}, **dict(('i-'+str(other), None) for other in range(window))),
+                                                       'i-'+str(index), sleep=sleep)[0]
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=claim, args=(index,)) for index in range(CLAIMANTS)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+        return [results, delays, errors]
+
+    def checkClaims(self, client, results, delays):
+        # unique slots, each claimant's IP in exactly one slot, and bounded jittered retries
+        self.assertEqual(len(set(results.values())), CLAIMANTS)
+        for index in results:
+            held = [key[1] for key, item in client.items.items() if item['ip']['S'] == '10.0.1.'+str(index)]
+            self.assertEqual(held, [results[index]])
+        for index in delays:
+            self.assertLess(len(delays[index]), state_table.MAX_CLAIM_ATTEMPTS)
+            for attempt, delay in enumerate(delays[index], 1):
+                self.assertGreaterEqual(delay, 0)
+                self.assertLessEqual(delay, min(state_table.CLAIM_MAX_DELAY, state_table.CLAIM_INITIAL_DELAY * (2 ** attempt)))
+        attempts = [len(delays[index]) + 1 for index in delays]
+        print('claims: attempts max='+str(max(attempts))+' mean='+('%.2f' % (sum(attempts) / float(len(attempts))))+
+              ' retries='+str(sum(attempts) - len(attempts))+' failed_conditions='+str(client.failedConditions))
+
+    def testFiftyConcurrentClaims(self):
+        client = FakeDynamoDB()
+        results, delays, errors = self.claimAll(client, CLAIMANTS, CLAIMANTS)
+        self.assertEqual(errors, [])
+        self.checkClaims(client, results, delays)
+
+    def testFiftyClaimsRacingForTheSameSlots(self):
+        # each claimant thinks it is the only one launching, so they all go for the
+        # lowest free slot first and have to retry
+        client = FakeDynamoDB()
+        results, delays, errors = self.claimAll(client, CLAIMANTS, 1)
+        self.assertEqual(errors, [])
+        self.checkClaims(client, results, delays)
+        self.assertGreater(client.failedConditions, 0)
+
+    def testLateClaimantsBackOffUntilSlotsAreReleased(self):
+        # 10 of the slots are still held by instances that are being scaled in, and are only
+        # released once the other 40 have been claimed and the 10 left over have backed off
+        maxinstances = CLAIMANTS
+        items = [{'cluster': {'S': CLUSTER}, 'slot': {'S': CLUSTER+str(number)}, 'ip': {'S': '10.0.9.'+str(number)}}
+                 for number in range(41, 51)]
+        client = FakeDynamoDB(items)
+        asg = dict(('i-old'+str(number), number) for number in range(41, 51))
+        delays = dict((index, []) for index in range(CLAIMANTS))
+        def release():
+            while (len([item for item in list(client.items.values()) if item['ip']['S'].startswith('10.0.1.')]) < 40 or
+                   len([index for index in delays if delays[index]]) < 10):
+                time.sleep(0.001)
+            for number in range(41, 51):
+                state_table.updateSlot(client, TABLENAME, CLUSTER, CLUSTER+str(number), state_table.FREE_IP)
+        releaser = threading.Timer(0, release)
+        releaser.start()
+        results, delays, errors = self.claimAll(client, maxinstances, CLAIMANTS, asg, delays)
+        releaser.join()
+        self.assertEqual(errors, [])
+        self.checkClaims(client, results, delays)
+        self.assertGreaterEqual(len([index for index in delays if delays[index]]), 10)
+
+if __name__ == '__main__':
+    unittest.main()
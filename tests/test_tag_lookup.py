@@ -0,0 +1,64 @@
+import unittest
+from fakes import FakeAutoScaling, FakeClock, FakeSession, FakeTagEC2, useRole
+
+useRole('Kafka/install-kafka')
+import tag_lookup
+
+class TaggingEC2(FakeTagEC2):
+    # the ASG tags the instance after a number of polls
+    def __init__(self, instanceId, tag, after):
+        FakeTagEC2.__init__(self)
+        self.instanceId = instanceId
+        self.tag = tag
+        self.after = after
+
+    def get_paginator(self, operation):
+        if self.tagCalls + 1 >= self.after:
+            self.tags[self.instanceId] = self.tag
+        return FakeTagEC2.get_paginator(self, operation)
+
+class WaitForNameTagTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.time = tag_lookup.time
+        tag_lookup.time = self.clock
+
+    def tearDown(self):
+        tag_lookup.time = self.time
+
+    def wait(self, ec2, asg, deadline=60, initialDelay=0.5, maxDelay=4):
+        session = FakeSession(ec2=ec2, autoscaling=asg)
+        return tag_lookup.waitForNameTag(session, 'i-1', 'eu-west-1', deadline, initialDelay, maxDelay, sleep=self.clock.sleep)
+
+    def testReturnsTheTagOnceItAppears(self):
+        ec2 = TaggingEC2('i-1', 'kafka3', 4)
+        self.assertEqual(self.wait(ec2, FakeAutoScaling('Pending')), 'kafka3')
+        self.assertEqual(ec2.tagCalls, 4)
+        self.assertEqual(len(self.clock.sleeps), 3)
+
+    def testBackoffHasFullJitterWithinTheBounds(self):
+        for run in range(50):
+            self.clock.sleeps = []
+            self.wait(TaggingEC2('i-1', 'kafka3', 8), FakeAutoScaling('Pending'))
+            for attempt, delay in enumerate(self.clock.sleeps, 1):
+                self.assertGreaterEqual(delay, 0)
+                self.assertLessEqual(delay, min(4, 0.5 * (2 ** attempt)))
+        # jittered, so the delays aren't all the same
+        self.assertGreater(len(set(self.clock.sleeps)), 1)
+
+    def testGivesUpAtTheDeadline(self):
+        started = self.clock.now
+        self.assertEqual(self.wait(FakeTagEC2(), FakeAutoScaling('Pending'), deadline=30), '')
+        # the last sleep is cut short so the wait ends on the deadline, not after it
+        self.assertAlmostEqual(self.clock.now - started, 30)
+        self.assertGreater(len(self.clock.sleeps), 5)
+
+    def testStopsOnceTheAsgHasSettledTheInstance(self):
+        ec2 = FakeTagEC2()
+        self.assertEqual(self.wait(ec2, FakeAutoScaling('InService')), '')
+        # one more poll after seeing the settled state
+        self.assertEqual(ec2.tagCalls, 2)
+        self.assertEqual(len(self.clock.sleeps), 1)
+
+if __name__ == '__main__':
+    unittest.main()
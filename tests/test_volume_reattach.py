@@ -0,0 +1,83 @@
+import unittest
+from fakes import FakeEC2, useRole
+
+useRole('Kafka/install-kafka')
+import volume_reattach
+
+DEVICE = volume_reattach.DATA_DEVICE
+
+class ReattachTest(unittest.TestCase):
+    def setUp(self):
+        # the new instance launched with a fresh volume, the slot's old volume is on the dead one
+        self.ec2 = FakeEC2()
+        self.ec2.addInstance('i-new')
+        self.ec2.addInstance('i-old', 'terminated')
+        self.ec2.addVolume('vol-fresh', 'eu-west-1a', 'i-new', DEVICE)
+        self.ec2.addVolume('vol-old', 'eu-west-1a', 'i-old', DEVICE)
+        self.commands = []
+        self.mountFails = False
+        self.volumeWait = volume_reattach.VOLUME_WAIT
+
+    def tearDown(self):
+        volume_reattach.VOLUME_WAIT = self.volumeWait
+
+    def reattach(self):
+        # track which volume each mount command mounts as it runs
+        mounts = []
+        def run(command):
+            self.commands.append(command)
+            if command[1] == 'mount':
+                if self.mountFails and self.ec2.getDevice('i-new', DEVICE) == 'vol-old':
+                    raise Exception('mount failed')
+                mounts.append(self.ec2.getDevice('i-new', DEVICE))
+            elif command[1] == 'umount':
+                mounts.append(None)
+        result = volume_reattach.reattach(self.ec2, 'vol-old', 'i-new', 'eu-west-1a', run=run,
+                                          deviceExists=lambda device: self.ec2.getDevice('i-new', device) is not None,
+                                          sleep=lambda seconds: None)
+        return [result, mounts[-1] if mounts else 'unchanged']
+
+    def testSwapsInTheOldVolumeBeforeDeletingTheFreshOne(self):
+        result, mounted = self.reattach()
+        self.assertEqual(result, 'vol-old')
+        self.assertEqual(mounted, 'vol-old')
+        calls = self.ec2.calls
+        self.assertNotIn('vol-fresh', self.ec2.volumes)
+        self.assertLess(calls.index(('attach', 'vol-old')), calls.index(('delete', 'vol-fresh')))
+        self.assertEqual(calls[-1], ('delete', 'vol-fresh'))
+
+    def testFreshVolumeIsKeptWhenTheAttachFails(self):
+        self.ec2.failures[('attach', 'vol-old')] = 'IncorrectState'
+        result, mounted = self.reattach()
+        self.assertIsNone(result)
+        self.assertNotIn(('delete', 'vol-fresh'), self.ec2.calls)
+        self.assertIn('vol-fresh', self.ec2.volumes)
+        self.assertEqual(self.ec2.getDevice('i-new', DEVICE), 'vol-fresh')
+        self.assertEqual(mounted, 'vol-fresh')
+
+    def testFreshVolumeIsKeptWhenTheMountFails(self):
+        self.mountFails = True
+        result, mounted = self.reattach()
+        self.assertIsNone(result)
+        self.assertNotIn(('delete', 'vol-fresh'), self.ec2.calls)
+        self.assertEqual(self.ec2.volumes['vol-old']['State'], 'available')
+        self.assertEqual(mounted, 'vol-fresh')
+
+    def testKeepsTheFreshVolumeWhenTheOldBrokerHoldsOn(self):
+        # the old instance is still running, so the detach isn't forced and never completes
+        self.ec2.instances['i-old'] = 'running'
+        self.ec2.stuck.add('vol-old')
+        volume_reattach.VOLUME_WAIT = 0
+        result, mounted = self.reattach()
+        self.assertIsNone(result)
+        self.assertEqual(mounted, 'unchanged')
+        self.assertEqual(self.ec2.calls, [('detach', 'vol-old')])
+        self.assertEqual(self.ec2.getDevice('i-new', DEVICE), 'vol-fresh')
+
+    def testKeepsTheFreshVolumeForAnotherAz(self):
+        self.ec2.volumes['vol-old']['AvailabilityZone'] = 'eu-west-1b'
+        self.assertEqual(self.reattach(), [None, 'unchanged'])
+        self.assertEqual(self.ec2.calls, [])
+
+if __name__ == '__main__':
+    unittest.main()